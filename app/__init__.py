@@ -1,6 +1,7 @@
 from flask import Flask
 from config import config
 from flask_sqlalchemy import SQLAlchemy
+from . import serializer, database, profiling, metrics
 
 db = SQLAlchemy()
 
@@ -10,6 +11,16 @@ def create_app( config_name ):
     config[config_name].init_app(app)
 
     db.init_app(app)
+    database.init_app(app, db)
+    serializer.init_app(app)
+    profiling.init_app(app, db)
+    metrics.init_app(app, db)
+
+    from .cache import cache
+    cache.init_app(app)
+
+    from .jobs import jobs
+    jobs.init_app(app)
 
     """ Создание макета экземпляра приложения
     """
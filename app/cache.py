@@ -0,0 +1,369 @@
+import hashlib, os, sqlite3, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, request
+from .models import Import
+from . import metrics
+
+class LRUCache:
+    """ Кэш в памяти процесса с вытеснением давно не использованных
+    записей. Размер ограничен суммарной длиной значений в байтах,
+    значения длиннее max_item не сохраняются
+    """
+    shared = False
+
+    def __init__( self, max_size, max_item ):
+        self.max_size = max_size
+        self.max_item = min( max_item, max_size )
+        self.size = 0
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config( cls, config ):
+        return cls( config['RESPONSE_CACHE_SIZE'], config['RESPONSE_CACHE_MAX_ITEM'] )
+
+    def get( self, key ):
+        with self.lock:
+            item = self.data.get( key )
+            if item is None:
+                return None
+
+            value, expires = item
+            if expires is not None and expires < time.time():
+                self._pop( key )
+                return None
+
+            self.data.move_to_end( key )
+            return value
+
+    def set( self, key, value, ttl = None ):
+        if len(value) > self.max_item:
+            return
+
+        with self.lock:
+            self._set( key, value, ttl )
+
+    def set_max( self, key, value, ttl = None ):
+        """ Сохраняет целое value, если оно больше текущего значения
+        (или текущей записи нет, или ее время жизни истекло)
+        """
+        value = b'%d' % value
+        with self.lock:
+            item = self.data.get( key )
+            if item is not None and ( item[1] is None or item[1] >= time.time() ) and \
+               int( item[0] ) >= int( value ):
+                return True
+            self._set( key, value, ttl )
+        return True
+
+    def delete( self, key ):
+        with self.lock:
+            self._pop( key )
+        return True
+
+    def _set( self, key, value, ttl ):
+        self._pop( key )
+
+        self.data[key] = ( value, time.time() + ttl if ttl is not None else None )
+        self.size += len(value)
+
+        while self.size > self.max_size:
+            _, ( old, _ ) = self.data.popitem( last = False )
+            self.size -= len(old)
+
+    def _pop( self, key ):
+        item = self.data.pop( key, None )
+        if item is not None:
+            self.size -= len(item[0])
+
+    def clear( self ):
+        with self.lock:
+            self.data.clear()
+            self.size = 0
+
+class SQLiteCache:
+    """ Кэш в файле SQLite, общий для всех процессов на сервере
+    (рабочих процессов gunicorn). Вытесняются записи с самым давним
+    обращением; время обращения обновляется не чаще раза в секунду.
+    Ошибки файла кэша (например, блокировка) считаются промахом.
+
+    Ключи записей входят в пространство имен namespace (адрес базы 
+    данных), поэтому экземпляры с разными базами не видят записи друг друга
+    """
+    shared = True
+
+    def __init__( self, path, max_size, max_item, namespace = '' ):
+        self.path = path
+        self.max_size = max_size
+        self.max_item = min( max_item, max_size )
+        self.namespace = namespace
+        self.local = threading.local()
+
+    @classmethod
+    def from_config( cls, config ):
+        return cls( config['RESPONSE_CACHE_PATH'], config['RESPONSE_CACHE_SIZE'],
+                    config['RESPONSE_CACHE_MAX_ITEM'], config['SQLALCHEMY_DATABASE_URI'] )
+
+    @property
+    def connection( self ):
+        # Соединение не передается между потоками и через fork
+        if getattr( self.local, 'pid', None ) != os.getpid():
+            connection = sqlite3.connect( self.path, timeout = 1, isolation_level = None )
+            connection.execute( 'PRAGMA journal_mode = WAL' )
+            connection.execute( 'PRAGMA synchronous = OFF' )
+            connection.execute( 'CREATE TABLE IF NOT EXISTS cache ( key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                                'size INTEGER NOT NULL, expires REAL, accessed REAL NOT NULL )' )
+            connection.execute( 'CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache ( accessed )' )
+
+            # Суммарный размер записей хранится в одной строке cache_size и
+            # изменяется триггерами в той же транзакции, что и записи
+            connection.execute( 'CREATE TABLE IF NOT EXISTS cache_size ( id INTEGER PRIMARY KEY CHECK ( id = 0 ), '
+                                'size INTEGER NOT NULL )' )
+            connection.execute( 'INSERT OR IGNORE INTO cache_size ( id, size ) '
+                                'SELECT 0, COALESCE(SUM(size), 0) FROM cache' )
+            connection.execute( 'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN '
+                                'UPDATE cache_size SET size = size + new.size; END' )
+            connection.execute( 'CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN '
+                                'UPDATE cache_size SET size = size - old.size + new.size; END' )
+            connection.execute( 'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN '
+                                'UPDATE cache_size SET size = size - old.size; END' )
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return self.local.connection
+
+    def hash( self, key ):
+        return hashlib.sha1( repr( (self.namespace, key) ).encode('utf-8') ).hexdigest()
+
+    def get( self, key ):
+        key, now = self.hash( key ), time.time()
+        try:
+            row = self.connection.execute( 'SELECT value, expires, accessed FROM cache WHERE key = ?', (key,) ).fetchone()
+            if row is None:
+                return None
+
+            value, expires, accessed = row
+            if expires is not None and expires < now:
+                return None
+
+            if now - accessed > 1:
+                self.connection.execute( 'UPDATE cache SET accessed = ? WHERE key = ?', (now, key) )
+            return value
+        except sqlite3.Error:
+            return None
+
+    def set( self, key, value, ttl = None ):
+        if len(value) > self.max_item:
+            return
+
+        key, now = self.hash( key ), time.time()
+        try:
+            with self.transaction() as connection:
+                connection.execute( 'INSERT INTO cache ( key, value, size, expires, accessed ) VALUES ( ?, ?, ?, ?, ? ) '
+                                    'ON CONFLICT ( key ) DO UPDATE SET value = excluded.value, size = excluded.size, '
+                                    'expires = excluded.expires, accessed = excluded.accessed',
+                                    (key, value, len(value), now + ttl if ttl is not None else None, now) )
+
+                size, = connection.execute( 'SELECT size FROM cache_size' ).fetchone()
+                while size > self.max_size:
+                    key, old = connection.execute( 'SELECT key, size FROM cache ORDER BY accessed LIMIT 1' ).fetchone()
+                    connection.execute( 'DELETE FROM cache WHERE key = ?', (key,) )
+                    size -= old
+        except sqlite3.Error:
+            pass
+
+    @contextmanager
+    def transaction( self ):
+        """ Транзакция с блокировкой на запись с самого начала
+        """
+        connection = self.connection
+        connection.execute( 'BEGIN IMMEDIATE' )
+        try:
+            yield connection
+        except Exception:
+            if connection.in_transaction:
+                connection.execute( 'ROLLBACK' )
+            raise
+        connection.execute( 'COMMIT' )
+
+    def set_max( self, key, value, ttl = None ):
+        """ Сохраняет целое value, если оно больше текущего значения
+        (или текущей записи нет, или ее время жизни истекло). Сравнение 
+        и запись выполняются одним запросом, поэтому меньшее значение 
+        не перезапишет большее при одновременной записи из разных процессов.
+
+        Возвращает False, если записать значение не удалось
+        """
+        key, now = self.hash( key ), time.time()
+        try:
+            self.connection.execute(
+                'INSERT INTO cache ( key, value, size, expires, accessed ) VALUES ( ?, ?, 8, ?, ? ) '
+                'ON CONFLICT ( key ) DO UPDATE SET '
+                'value = CASE WHEN cache.expires < excluded.accessed THEN excluded.value '
+                'ELSE max( CAST( cache.value AS INTEGER ), excluded.value ) END, '
+                'expires = excluded.expires, accessed = excluded.accessed',
+                (key, int(value), now + ttl if ttl is not None else None, now) )
+            return True
+        except sqlite3.Error:
+            return False
+
+    def delete( self, key ):
+        """ Удаляет запись; возвращает False, если удалить не удалось
+        """
+        try:
+            self.connection.execute( 'DELETE FROM cache WHERE key = ?', (self.hash( key ),) )
+            return True
+        except sqlite3.Error:
+            return False
+
+    def clear( self ):
+        try:
+            self.connection.execute( 'DELETE FROM cache' )
+        except sqlite3.Error:
+            pass
+
+BACKENDS = {
+    'memory': LRUCache,
+    'sqlite': SQLiteCache
+}
+
+class ResponseCache:
+    """ Кэш сериализованных ответов для чтения выгрузок. Ключ включает
+    версию выгрузки (Import.version), поэтому после изменения данных
+    старые записи больше не используются и вытесняются сами.
+
+    Хранилище задается настройкой RESPONSE_CACHE_BACKEND: memory - в
+    памяти процесса, sqlite - общий файл для всех процессов сервера. 
+    В хранилище же хранятся версии выгрузок (не дольше 
+    RESPONSE_CACHE_VERSION_TTL секунд), которые обновляются при PATCH,
+    и проверка ETag обходится без обращения к базе данных
+    """
+    def __init__( self, app = None ):
+        if app is not None:
+            self.init_app( app )
+
+    def init_app( self, app ):
+        backend = BACKENDS[ app.config['RESPONSE_CACHE_BACKEND'] ]
+        app.extensions['response_cache'] = backend.from_config( app.config )
+
+    @property
+    def backend( self ):
+        return current_app.extensions['response_cache']
+
+    def get( self, key ):
+        return self.backend.get( key )
+
+    def set( self, key, value ):
+        self.backend.set( key, value )
+
+    def get_version( self, import_id ):
+        """ Текущая версия выгрузки или None, если выгрузки нет
+        """
+        backend = self.backend
+        version = backend.get( ('version', import_id) )
+        if version is not None:
+            return int(version)
+
+        version = Import.get_version( import_id )
+        if version is not None:
+            self.set_version( import_id, version )
+        return version
+
+    def set_version( self, import_id, version ):
+        """ Сообщает новую версию выгрузки после фиксации изменений
+        (при общем хранилище - всем процессам). Версия в кэше только 
+        увеличивается
+        """
+        backend = self.backend
+        key = ('version', import_id)
+        if backend.set_max( key, version, current_app.config['RESPONSE_CACHE_VERSION_TTL'] ):
+            return
+
+        # Без удаления старой версии другие процессы отдавали бы прежние
+        # ответы и ETag до истечения RESPONSE_CACHE_VERSION_TTL
+        if backend.delete( key ):
+            current_app.logger.warning( 'Response cache: version %d of import %d is not published, '
+                                        'cached version removed', version, import_id )
+        else:
+            current_app.logger.error( 'Response cache: version %d of import %d is not published, '
+                                      'stale responses possible for %d s', version, import_id,
+                                      current_app.config['RESPONSE_CACHE_VERSION_TTL'] )
+
+cache = ResponseCache()
+
+def clear_shared( config ):
+    """ Очистка общего кэша ответов при запуске сервера (gunicorn, 
+    on_starting). Файл кэша переживает перезапуск службы, а база данных
+    могла быть пересоздана или восстановлена из копии с теми же номерами
+    и версиями выгрузок. При создании приложения кэш не очищается: оно
+    создается в каждом рабочем процессе и в каждой команде manage.py
+    """
+    backend = BACKENDS[ config['RESPONSE_CACHE_BACKEND'] ]
+    if backend.shared:
+        backend.from_config( config ).clear()
+
+def _tee( chunks, backend, key ):
+    """ Передает части потокового ответа дальше и сохраняет ответ
+    в кэш, если он целиком поместился в допустимый размер записи
+    """
+    parts, size, limit = [], 0, backend.max_item
+
+    for chunk in chunks:
+        if parts is not None:
+            parts.append( chunk )
+            size += len(chunk)
+            if size > limit:
+                parts = None
+        yield chunk
+
+    if parts is not None:
+        backend.set( key, b''.join(parts) )
+
+def cached( vary = None ):
+    """ Декоратор функций представления вида view(import_id, ...).
+
+    Ответ 200 сохраняется в кэш по ключу (endpoint, import_id, версия,
+    параметры запроса, vary()) и снабжается заголовком ETag; запрос с
+    совпадающим If-None-Match получает 304 без выполнения функции
+    """
+    def decorator( view ):
+        @wraps( view )
+        def wrapper( import_id, **kwargs ):
+            if not current_app.config['RESPONSE_CACHE']:
+                return view( import_id, **kwargs )
+
+            version = cache.get_version( import_id )
+            if version is None:
+                return view( import_id, **kwargs )
+
+            key = ( request.endpoint, import_id, version, request.query_string,
+                    vary() if vary is not None else None )
+            etag = '%d-%d-%s' % ( import_id, version, hashlib.md5( repr(key).encode('utf-8') ).hexdigest()[:16] )
+
+            labels = { 'route': metrics.route() }
+            if request.if_none_match.contains( etag ):
+                metrics.inc( 'response_cache_total', dict( labels, result = 'not_modified' ) )
+                response = current_app.response_class( status = 304 )
+                response.set_etag( etag )
+                return response
+
+            body = cache.get( key )
+            metrics.inc( 'response_cache_total', dict( labels, result = 'miss' if body is None else 'hit' ) )
+            if body is not None:
+                response = current_app.response_class( body, mimetype = current_app.config['JSONIFY_MIMETYPE'] )
+                response.set_etag( etag )
+                return response
+
+            response = current_app.make_response( view( import_id, **kwargs ) )
+            if response.status_code != 200:
+                return response
+
+            if response.is_streamed:
+                response.response = _tee( response.response, cache.backend, key )
+            else:
+                cache.set( key, response.get_data() )
+
+            response.set_etag( etag )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,18 @@
+from sqlalchemy import event
+
+def init_app( app, db ):
+    """ Выполняет PRAGMA из настройки SQLITE_PRAGMAS при каждом новом 
+    соединении с базой данных SQLite приложения app
+    """
+    engine = db.get_engine( app )
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = list( app.config['SQLITE_PRAGMAS'].items() )
+
+    @event.listens_for( engine, 'connect' )
+    def set_pragmas( connection, record ):
+        cursor = connection.cursor()
+        for name, value in pragmas:
+            cursor.execute( 'PRAGMA %s = %s' % (name, value) )
+        cursor.close()
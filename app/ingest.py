@@ -0,0 +1,148 @@
+import itertools, multiprocessing, pickle, tempfile
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from flask import abort, current_app
+from werkzeug.exceptions import HTTPException
+from . import db, metrics
+from .models import Import, Citizen, Relative, Present
+from .validation import validator, parse_date, _unique
+from .relatives import set_relatives
+from .streaming import StreamError
+
+# Выгрузки, проверяемые в дочерних процессах: процессы пула создаются 
+# через fork и получают данные в унаследованной памяти, без сериализации
+_shared = {}
+_counter = itertools.count()
+
+def _check( token, start, end ):
+    """ Проверяет жителей start:end выгрузки _shared[token]. Возвращает
+    порядковые номера дат рождения (date.toordinal) или None, если в части
+    есть некорректный житель
+    """
+    citizens = _shared[token][start:end]
+    if not validator.validate_many( citizens ):
+        return None
+    return [ parse_date( citizen['birth_date'] ).toordinal() for citizen in citizens ]
+
+def _make_rows( citizens, ordinals ):
+    rows = []
+    for citizen, ordinal in zip( citizens, ordinals ):
+        row = { k: v for k, v in citizen.items() if k != 'relatives' }
+        born = date.fromordinal( ordinal )
+        row.update( birth_date = born, birth_month = born.month, birth_day = born.day )
+        rows.append( row )
+    return rows
+
+def prepare_rows( citizens ):
+    """ Проверка выгрузки и подготовка строк жителей. Выгрузки не меньше
+    IMPORT_PARALLEL_MIN жителей делятся на части по IMPORT_CHUNK_SIZE, 
+    которые проверяются IMPORT_PROCESSES процессами (0 - без пула или 
+    если fork недоступен). Процессам передаются только границы частей,
+    обратно - номера дат рождения; строки собираются в процессе запроса
+    """
+    config = current_app.config
+    processes, chunk_size = config['IMPORT_PROCESSES'], config['IMPORT_CHUNK_SIZE']
+
+    if not processes or len(citizens) < config['IMPORT_PARALLEL_MIN'] or \
+       'fork' not in multiprocessing.get_all_start_methods():
+        if not validator.validate_many( citizens ):
+            abort(400)
+        return Citizen.make_rows( citizens )
+
+    token = next( _counter )
+    _shared[token] = citizens
+    try:
+        with ProcessPoolExecutor( max_workers = processes, mp_context = multiprocessing.get_context('fork') ) as executor:
+            bounds = range( 0, len(citizens), chunk_size )
+            chunks = list( executor.map( _check, [token] * len(bounds), bounds, [ i + chunk_size for i in bounds ] ) )
+    finally:
+        del _shared[token]
+
+    if any( chunk is None for chunk in chunks ):
+        abort(400)
+
+    return _make_rows( citizens, [ ordinal for chunk in chunks for ordinal in chunk ] )
+
+def save_import( citizens, batch_size, progress = None ):
+    """ Проверяет выгрузку целиком и сохраняет ее пакетными
+    INSERT-запросами. Возвращает import_id новой выгрузки. 
+    progress('saving') вызывается перед началом записи.
+
+    view function -> ('/imports', methods = ['POST'])
+    """
+    # Валидация всей выгрузки до записи в базу данных
+    if not isinstance( citizens, list ) or not citizens:
+        abort(400)
+
+    rows = prepare_rows( citizens )
+    if not _unique( citizens ):
+        abort(400)
+
+    set_relatives( citizens )
+
+    if progress is not None:
+        progress( 'saving' )
+
+    import_id = Import.create()
+
+    Citizen.insert_rows( import_id, rows, batch_size )
+    Relative.insert_many( import_id, citizens, batch_size )
+    Present.rebuild( import_id, batch_size = batch_size )
+    db.session.commit()
+
+    metrics.observe( 'import_citizens', {}, len(citizens) )
+    return import_id
+
+def save_import_stream( citizens, batch_size ):
+    """ Сохраняет выгрузку, жители которой поступают итератором citizens
+    (streaming.iter_citizens). Жители проверяются по мере чтения тела 
+    запроса, строки таблицы citizens пакетами по batch_size сохраняются во
+    временный файл; в памяти остается только граф родственных связей.
+
+    Запись в базу данных начинается после того, как тело прочитано целиком:
+    транзакция записи не ждет медленного клиента и не задерживает других
+    пишущих (в SQLite запись в базу выполняет одна транзакция за раз).
+    При ошибке выгрузка не сохраняется.
+
+    view function -> ('/imports', methods = ['POST'])
+    """
+    with tempfile.TemporaryFile() as spool:
+        try:
+            graph, batch, seen = [], [], set()
+            for citizen in citizens:
+                if not validator.validate(citizen) or citizen['citizen_id'] in seen:
+                    abort(400)
+
+                seen.add( citizen['citizen_id'] )
+
+                graph.append({ 'citizen_id': citizen['citizen_id'], 'relatives': citizen['relatives'] })
+                batch.append( citizen )
+
+                if len(batch) >= batch_size:
+                    pickle.dump( Citizen.make_rows( batch ), spool, pickle.HIGHEST_PROTOCOL )
+                    batch = []
+
+            if not graph:
+                abort(400)
+
+            pickle.dump( Citizen.make_rows( batch ), spool, pickle.HIGHEST_PROTOCOL )
+            set_relatives( graph )
+        except (HTTPException, StreamError):
+            abort(400)
+
+        import_id = Import.create()
+
+        spool.seek(0)
+        while True:
+            try:
+                rows = pickle.load( spool )
+            except EOFError:
+                break
+            Citizen.insert_rows( import_id, rows, batch_size )
+
+    Relative.insert_many( import_id, graph, batch_size )
+    Present.rebuild( import_id, batch_size = batch_size )
+    db.session.commit()
+
+    metrics.observe( 'import_citizens', {}, len(graph) )
+    return import_id
@@ -0,0 +1,136 @@
+import os, socket, threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, abort
+from werkzeug.exceptions import HTTPException
+from . import db
+from .models import ImportJob
+from .ingest import save_import
+
+def _started( pid ):
+    """ Время запуска процесса pid в тиках с загрузки системы (/proc, 
+    Linux) или None, если узнать его нельзя
+    """
+    try:
+        with open( '/proc/%d/stat' % pid ) as stat:
+            fields = stat.read().rpartition(')')[2].split()
+        return int( fields[19] )
+    except (OSError, IndexError, ValueError):
+        return None
+
+def owner( pid = None ):
+    """ Идентификатор процесса для ImportJob.owner: host:pid и, если 
+    известно, время запуска процесса (host:pid:started), по которому
+    отличается другой процесс с тем же номером
+    """
+    pid = pid or os.getpid()
+    started = _started( pid )
+    if started is None:
+        return '%s:%d' % ( socket.gethostname(), pid )
+    return '%s:%d:%d' % ( socket.gethostname(), pid, started )
+
+def _alive( pid, started = None ):
+    if started is not None and os.path.isdir( '/proc/self' ):
+        return _started( pid ) == started
+
+    try:
+        os.kill( pid, 0 )
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+class ImportJobs:
+    """ Пул фоновых загрузок выгрузок (IMPORT_ASYNC). Задачи выполняются 
+    потоками рабочего процесса, принявшего запрос; одновременно выполняется 
+    не более IMPORT_WORKERS задач и ожидает не более IMPORT_QUEUE_SIZE, 
+    остальные запросы отклоняются с кодом 503.
+
+    Задачи хранятся только в памяти процесса: если он завершился (перезапуск
+    или сбой рабочего процесса), незавершенные задачи этого сервера 
+    отмечаются как failed при запросе их статуса (check)
+    """
+    def __init__( self, app = None ):
+        self.pid = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app( app )
+
+    def init_app( self, app ):
+        app.extensions['import_jobs'] = self
+
+    def executor( self, app ):
+        # Пул создается при первой задаче в каждом процессе (после fork)
+        with self.lock:
+            if self.pid != os.getpid():
+                workers = app.config['IMPORT_WORKERS']
+                self.pool = ThreadPoolExecutor( max_workers = workers, thread_name_prefix = 'import' )
+                self.slots = threading.BoundedSemaphore( workers + app.config['IMPORT_QUEUE_SIZE'] )
+                self.pid = os.getpid()
+            return self.pool, self.slots
+
+    def submit( self, citizens ):
+        """ Ставит загрузку citizens в очередь, возвращает номер задачи
+        """
+        app = current_app._get_current_object()
+        pool, slots = self.executor( app )
+
+        if not slots.acquire( blocking = False ):
+            abort(503)
+
+        try:
+            job_id = ImportJob.create( len(citizens), owner() )
+            pool.submit( self.run, app, slots, job_id, citizens )
+        except:
+            slots.release()
+            raise
+
+        return job_id
+
+    @staticmethod
+    def check( job ):
+        """ Отмечает как failed незавершенную задачу job, процесс которой 
+        на этом сервере больше не существует (POSIX; номер процесса мог 
+        достаться другому процессу - сравнивается и время запуска), и 
+        задачу, не завершенную за IMPORT_JOB_TIMEOUT секунд на любом 
+        сервере. Если такая задача все же завершится, статус станет done
+        """
+        if job.status in ('done', 'failed'):
+            return
+
+        timeout = current_app.config['IMPORT_JOB_TIMEOUT']
+        if job.created < datetime.utcnow() - timedelta( seconds = timeout ):
+            ImportJob.set_status( job.id, 'failed', error = 'Timeout' )
+            db.session.refresh( job )
+            return
+
+        if job.owner is None or os.name != 'posix':
+            return
+
+        host, pid, *started = job.owner.split(':')
+        started = int( started[0] ) if started else None
+        if host == socket.gethostname() and not _alive( int(pid), started ):
+            ImportJob.set_status( job.id, 'failed', error = 'Worker Exited' )
+            db.session.refresh( job )
+
+    @staticmethod
+    def run( app, slots, job_id, citizens ):
+        with app.app_context():
+            try:
+                ImportJob.set_status( job_id, 'validating' )
+                progress = lambda status: ImportJob.set_status( job_id, status )
+                import_id = save_import( citizens, app.config['IMPORT_BATCH_SIZE'], progress )
+                ImportJob.set_status( job_id, 'done', import_id = import_id )
+            except HTTPException as e:
+                db.session.rollback()
+                ImportJob.set_status( job_id, 'failed', error = e.name )
+            except Exception:
+                app.logger.exception( 'Import job %d failed', job_id )
+                db.session.rollback()
+                ImportJob.set_status( job_id, 'failed', error = 'Internal Server Error' )
+            finally:
+                db.session.remove()
+                slots.release()
+
+jobs = ImportJobs()
@@ -1,14 +1,22 @@
 from . import main
-from flask import make_response, jsonify
+from ..serializer import json_response
 
 @main.app_errorhandler(400)
 def bad_request( e ):
-    return make_response( jsonify({ 'Error 400': 'Bad Request' }), 400 )
+    return json_response( { 'Error 400': 'Bad Request' }, 400 )
 
 @main.app_errorhandler(404)
 def not_found( e ):
-    return make_response( jsonify({ 'Error 404': 'Not Found' }), 404 )
+    return json_response( { 'Error 404': 'Not Found' }, 404 )
+
+@main.app_errorhandler(413)
+def payload_too_large( e ):
+    return json_response( { 'Error 413': 'Payload Too Large' }, 413 )
 
 @main.app_errorhandler(500)
 def internal_server_error( e ):
-    return make_response( jsonify({ 'Error 500': 'Internal Server Error' }), 500 )
\ No newline at end of file
+    return json_response( { 'Error 500': 'Internal Server Error' }, 500 )
+
+@main.app_errorhandler(503)
+def service_unavailable( e ):
+    return json_response( { 'Error 503': 'Service Unavailable' }, 503 )
@@ -1,13 +1,19 @@
-import time, pickle, numpy as np
-from datetime import datetime
+import time, numpy as np
+from datetime import datetime, date
 
 from .. import db
 from . import main
-from flask import jsonify, make_response, request, abort
-from ..models import Import, Citizen
-from ..validation import cerberus, cerberus_lite, _unique
-from ..relatives import set_relatives, new_relatives
-from sqlalchemy.orm import load_only
+from flask import request, abort, current_app, url_for, Response, stream_with_context
+from ..models import Import, ImportJob, Citizen, Relative, Present
+from ..validation import validator_lite, parse_date, parse_fields, schema
+from ..relatives import new_relatives, update_relatives
+from ..ingest import save_import, save_import_stream
+from ..stats import get_ages, group_percentiles
+from ..streaming import citizens_json, iter_citizens
+from ..serializer import json_response, request_json
+from ..cache import cache, cached
+from ..jobs import jobs
+from .. import metrics
 
 @main.after_request
 def apply_caching( e ):
@@ -16,7 +22,18 @@ def apply_caching( e ):
     e.headers["Date"] = datetime.today().strftime('%a, %d %b %Y %H:%M:%S GMT')
     return e
 
+@main.route('/metrics', methods = ['GET'])
+def get_metrics():
+    """ Метрики всех рабочих процессов в формате Prometheus
+    """
+    registry = metrics.registry()
+    if registry is None:
+        abort(404)
+
+    return Response( registry.render(), 200, mimetype = 'text/plain; version=0.0.4' )
+
 @main.route('/imports/<int:import_id>/citizens', methods = ['GET'])
+@cached()
 def get_citizens( import_id ):
     """ Возвращает список всех жителей для указанного 
     набора данных
@@ -26,128 +43,250 @@ def get_citizens( import_id ):
     if imports is None:
         abort(404) 
 
-    citizens = imports.citizens.all()
-    return jsonify({ 'data': [ citizen.to_json() for citizen in citizens ] }), 200
+    fields = fields_arg()
+    if 'limit' in request.args or 'after_citizen_id' in request.args:
+        return citizens_page( import_id, fields )
+
+    chunk_size = current_app.config['CITIZENS_STREAM_CHUNK']
+    return Response( stream_with_context( citizens_json(import_id, chunk_size, fields) ), 200,
+                     mimetype = 'application/json' )
+
+def int_arg( name, default ):
+    """ Целочисленный параметр запроса; 400, если это не число
+    """
+    value = request.args.get( name )
+    if value is None:
+        return default
+
+    try:
+        return int(value)
+    except ValueError:
+        abort(400)
+
+def fields_arg():
+    """ Поля жителя из параметра запроса fields (по умолчанию - все поля
+    схемы); 400, если поле не из схемы
+    """
+    if 'fields' not in request.args:
+        return tuple( schema )
+
+    try:
+        return parse_fields( request.args['fields'] )
+    except ValueError:
+        abort(400)
+
+def citizens_page( import_id, fields ):
+    """ Страница жителей выгрузки в порядке citizen_id: не более limit
+    жителей после after_citizen_id. Стоимость запроса не зависит от номера 
+    страницы; адрес следующей страницы - в поле next и заголовке Link
+    """
+    limit = int_arg( 'limit', current_app.config['CITIZENS_PAGE_SIZE'] )
+    after = int_arg( 'after_citizen_id', -1 )
+    if limit < 1:
+        abort(400)
+    limit = min( limit, current_app.config['CITIZENS_PAGE_MAX'] )
+
+    columns = [ field for field in fields if field != 'relatives' ]
+    rows = Citizen.get_page( import_id, after, limit + 1, columns )
+    more, rows = len(rows) > limit, rows[:limit]
+
+    if 'relatives' in fields:
+        relatives = Relative.get_map( import_id, rows[0].citizen_id, rows[-1].citizen_id ) if rows else {}
+        data = [ Citizen.row_to_json( row, relatives.get(row.citizen_id, []), columns ) for row in rows ]
+    else:
+        data = [ Citizen.row_to_json( row, None, columns ) for row in rows ]
+
+    next_page = None
+    if more:
+        next_page = url_for( 'main.get_citizens', import_id = import_id, limit = limit,
+                             after_citizen_id = rows[-1].citizen_id, fields = request.args.get('fields') )
+
+    response = json_response({ 'data': data, 'next': next_page }, 200 )
+    if next_page is not None:
+        response.headers['Link'] = '<%s>; rel="next"' % next_page
+    return response
 
 @main.route('/imports', methods = ['POST'])
 def post_citizens():
     """ Принимает на вход набор с данными о жителях в формате json 
     и сохраняет его с уникальным идентификатором import_id
     """
-    if not request.json or not 'citizens' in request.json or \
-    len(request.json['citizens']) == 0:
-        abort(400)
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
 
-    if not _unique( request.json['citizens'] ):
-        abort(400)
-    
-    import_id = Import.get_index()
+    # Размер тела известен до чтения: слишком большая выгрузка отклоняется сразу
+    if ( request.content_length or 0 ) > current_app.config['MAX_CONTENT_LENGTH']:
+        abort(413)
 
-    for citizen in request.json['citizens']:
-        if not cerberus.validate(citizen):
+    if current_app.config['IMPORT_ASYNC']:
+        data = request_json()
+        if not data or not isinstance( data.get('citizens'), list ) or len(data['citizens']) == 0:
             abort(400)
-        
-        citizen['import_id'] = import_id
-        citizen['relatives'] = pickle.dumps(citizen['relatives'])
 
-        new_citizen = Citizen( **citizen )
-        db.session.add(new_citizen)
+        job_id = jobs.submit( data['citizens'] )
+        response = json_response({ 'data' : {'job_id': job_id, 'status': 'queued'} }, 202 )
+        response.headers['Location'] = url_for( 'main.get_import_job', job_id = job_id )
+        return response
 
-    db.session.add( Import() )
-    db.session.commit()
+    if current_app.config['IMPORT_STREAMING']:
+        citizens = iter_citizens( request.stream, current_app.config['IMPORT_MAX_CITIZEN_SIZE'] )
+        import_id = save_import_stream( citizens, batch_size )
+        return json_response({ 'data' : {'import_id': import_id} }, 201 )
+
+    data = request_json()
+    if not data or not 'citizens' in data or len(data['citizens']) == 0:
+        abort(400)
+
+    import_id = save_import( data['citizens'], batch_size )
+
+    return json_response({ 'data' : {'import_id': import_id} }, 201 )
 
-    set_relatives( import_id )
+@main.route('/imports/jobs/<int:job_id>', methods = ['GET'])
+def get_import_job( job_id ):
+    """ Возвращает статус фоновой загрузки выгрузки
+    """
+    job = ImportJob.query.get( job_id )
+    if job is None:
+        abort(404)
 
-    return jsonify({ 'data' : {'import_id': import_id} }), 201
+    jobs.check( job )
+    return json_response({ 'data': job.to_json() }, 200 )
 
 @main.route('/imports/<int:import_id>/citizens/<int:citizen_id>', methods = ['PATCH'])
 def patch_citizen( import_id, citizen_id ):
     """ Изменяет информацию о жителе в указанном наборе данных
     """
-    if not request.json or 'citizen_id' in request.json or \
-    len(request.json) == 0:
+    data = request_json()
+    if not data or 'citizen_id' in data or len(data) == 0:
         abort(400)
 
     citizen = Citizen.query.filter_by( import_id = import_id, citizen_id = citizen_id ).first()
     if citizen is None:
         abort(404)
 
-    old_relatives = pickle.loads(citizen.relatives)
+    old_relatives = Relative.get_list( import_id, citizen_id )
 
-    if not cerberus_lite.validate(request.json):
+    # Все проверки запроса - до первого изменения: при COMMIT_ON_TEARDOWN
+    # частичные изменения без пересчета подарков и версии были бы сохранены
+    if not validator_lite.validate(data) or citizen_id in data.get('relatives', ()):
         abort(400)
     
-    for k, v in request.json.items():
-        if k != 'relatives':
+    for k, v in data.items():
+        if k == 'birth_date':
+            citizen.set_birth_date( parse_date(v) )
+        elif k != 'relatives':
             setattr( citizen, k, v )
         else:
-            if citizen_id in v:
-                abort(400)
-            setattr( citizen, k, pickle.dumps(v) )
+            # new_relatives откатывает транзакцию перед отказом
             new_relatives( import_id, citizen_id, old_relatives, v )
 
+    if 'birth_date' in data or 'relatives' in data:
+        # Подарки родственников жителя и его собственные (через обратные связи)
+        db.session.add(citizen)
+        Present.rebuild( import_id, [ citizen_id ] + old_relatives + Relative.get_list(import_id, citizen_id),
+                         current_app.config['IMPORT_BATCH_SIZE'] )
+
+    Import.bump_version( import_id )
     db.session.add(citizen)
     db.session.commit()
 
-    return jsonify({ 'data': citizen.to_json() }), 200
+    cache.set_version( import_id, Import.get_version(import_id) )
+
+    return json_response({ 'data': citizen.to_json( Relative.get_list(import_id, citizen_id) ) }, 200 )
+
+@main.route('/imports/<int:import_id>/citizens', methods = ['PATCH'])
+def patch_citizens( import_id ):
+    """ Изменяет информацию о нескольких жителях указанного набора данных
+    в одной транзакции. Изменения {"citizens": [{"citizen_id": ..., ...}]}
+    применяются по порядку с тем же результатом, что и последовательные 
+    PATCH /imports/<import_id>/citizens/<citizen_id>; при ошибке в любом
+    из них не применяется ни одно
+    """
+    data = request_json()
+    updates = data.get('citizens') if isinstance( data, dict ) else None
+    if not updates or not isinstance( updates, list ):
+        abort(400)
+
+    if not validator_lite.validate_many( updates ):
+        abort(400)
+
+    for update in updates:
+        if 'citizen_id' not in update or len(update) < 2 or update['citizen_id'] in update.get('relatives', ()):
+            abort(400)
+
+    citizens = Citizen.get_many( import_id, [ update['citizen_id'] for update in updates ] )
+    if len(citizens) < len({ update['citizen_id'] for update in updates }):
+        abort(404)
+
+    relatives, affected = update_relatives( import_id, [ (update['citizen_id'], update.get('relatives')) for update in updates ],
+                                            current_app.config['IMPORT_BATCH_SIZE'] )
+
+    for update in updates:
+        citizen = citizens[ update['citizen_id'] ]
+        for k, v in update.items():
+            if k == 'birth_date':
+                citizen.set_birth_date( parse_date(v) )
+            elif k not in ('citizen_id', 'relatives'):
+                setattr( citizen, k, v )
+
+        if 'birth_date' in update:
+            # Подарки родственников жителя; связи, удаленные позже, уже в affected
+            affected.add( citizen.citizen_id )
+            affected.update( relatives[citizen.citizen_id] )
+
+    if affected:
+        db.session.flush()
+        Present.rebuild( import_id, affected, current_app.config['IMPORT_BATCH_SIZE'] )
+
+    # Ответ собирается до фиксации, пока объекты жителей не устарели
+    patched = dict.fromkeys( update['citizen_id'] for update in updates )
+    result = [ citizens[citizen_id].to_json( relatives[citizen_id] ) for citizen_id in patched ]
+
+    Import.bump_version( import_id )
+    db.session.commit()
+
+    cache.set_version( import_id, Import.get_version(import_id) )
+
+    return json_response({ 'data': result }, 200 )
 
 @main.route('/imports/<int:import_id>/citizens/birthdays', methods = ['GET'])
+@cached()
 def get_birthdays( import_id ):
     """ Возвращает жителей и количество подарков, которые 
     они будут покупать своим ближайшим родственникам, 
     сгруппированных по месяцам из указанного набора данных
     """
-    citizens = Citizen.query.filter_by( import_id = import_id ).all()
-
-    if not citizens:
+    if Import.get_version( import_id ) is None:
         abort(404)
 
-    data = dict( (str(i), []) for i in range(1,13) )
-
-    for сitizen in citizens:
-        month = сitizen.get_month_birth()
-        relatives = pickle.loads(сitizen.relatives)
-
-        if not relatives:
-            continue
+    # Подарки хранятся в таблице presents, которая обновляется при 
+    # загрузке и изменении жителей
+    data = dict( (str(month), [ { 'citizen_id': citizen_id, 'present': present } 
+                                for citizen_id, present in presents ])
+                 for month, presents in Present.get_months( import_id ).items() )
 
-        for relative in relatives:
-            if not data[month]:
-                data[month].append({ 'citizen_id': relative,
-                                     'present': 1 })
-            else:
-                for el in data[month]:
-                    if el['citizen_id'] == relative:
-                        el['present'] += 1
-                        break
-                else:
-                    data[month].append({ 'citizen_id': relative,
-                                         'present': 1 })
-
-    return jsonify({'data': data}), 200
+    return json_response({'data': data}, 200 )
 
 @main.route('/imports/<int:import_id>/towns/stat/percentile/age', methods = ['GET'])
+@cached( vary = lambda: date.today() ) # возраст зависит от текущей даты
 def get_percentile( import_id ):
     """ Возвращает статистику по городам для указанного 
     набора данных в разрезе возраста (полных лет) жителей
     """
-    towns = db.session.query(Citizen.town).filter(Citizen.import_id == import_id).\
-                       group_by(Citizen.town).all()
+    rows = db.session.query( Citizen.town, Citizen.birth_date ).\
+                      filter( Citizen.import_id == import_id ).all()
 
-    if not towns:
+    if not rows:
         abort(404)
 
-    towns = [ town[0] for town in towns ]
+    towns, birth_dates = zip(*rows)
+    towns, groups = np.unique( towns, return_inverse = True )
+
+    ages = get_ages( np.array( birth_dates, dtype = 'datetime64[D]' ), date.today() )
+
+    groups, percentiles = group_percentiles( groups, ages, [50, 75, 99] )
+    percentiles = np.round( percentiles, 2 ).tolist()
 
-    data = []
-    for town in towns:
-        citizens = Citizen.query.filter_by( import_id = import_id, town = town ).all()
-        age = [ citizen.get_age() for citizen in citizens ]
-        data.append({
-            'town': town,
-            'p50': round( np.percentile(age, 50, interpolation = 'linear'), 2),
-            'p75': round( np.percentile(age, 75, interpolation = 'linear'), 2),
-            'p99': round( np.percentile(age, 99, interpolation = 'linear'), 2),
-        })
+    data = [ { 'town': town, 'p50': p50, 'p75': p75, 'p99': p99 }
+             for town, ( p50, p75, p99 ) in zip( towns[groups].tolist(), percentiles ) ]
 
-    return jsonify({'data': data}), 200
+    return json_response({'data': data}, 200 )
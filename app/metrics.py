@@ -0,0 +1,265 @@
+import atexit, glob, json, os, threading, time
+from time import perf_counter
+from flask import g, request, current_app, has_app_context
+
+# name -> ( тип, описание, границы корзин гистограммы )
+METRICS = {
+    'http_requests_total':
+        ( 'counter', 'Requests by route, method and status', None ),
+    'http_request_duration_seconds':
+        ( 'histogram', 'Request handling time by route', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10) ),
+    'http_request_size_bytes':
+        ( 'histogram', 'Request body size by route', (1e3, 1e4, 1e5, 1e6, 1e7, 1e8) ),
+    'http_response_size_bytes':
+        ( 'histogram', 'Response body size by route', (1e3, 1e4, 1e5, 1e6, 1e7, 1e8) ),
+    'import_citizens':
+        ( 'histogram', 'Citizens per saved import', (10, 100, 1e3, 1e4, 1e5, 1e6) ),
+    'response_cache_total':
+        ( 'counter', 'Response cache lookups by route and result (hit, miss, not_modified)', None ),
+    'db_pool_checkout_seconds':
+        ( 'histogram', 'Time to check out a database connection from the pool', (0.0001, 0.001, 0.01, 0.1, 1, 10) )
+}
+
+# Общий файл метрик завершившихся рабочих процессов
+EXITED = 'metrics-exited.json'
+
+def _read( path ):
+    try:
+        with open( path, encoding = 'utf-8' ) as f:
+            return json.load( f )
+    except (OSError, ValueError):
+        return None
+
+def _write( path, data ):
+    tmp = path + '.tmp'
+    with open( tmp, 'w', encoding = 'utf-8' ) as f:
+        f.write( data )
+    os.replace( tmp, path )
+
+def _add( total, values ):
+    for key, value in values.items():
+        if isinstance( value, list ):
+            current = total.setdefault( key, [0] * len(value) )
+            total[key] = [ a + b for a, b in zip( current, value ) ]
+        else:
+            total[key] = total.get( key, 0 ) + value
+
+def merge( directory, pid ):
+    """ Переносит метрики завершившегося процесса pid в общий файл EXITED,
+    чтобы число файлов в каталоге не росло с каждым перезапуском рабочих
+    процессов. Вызывается одним процессом (мастером gunicorn, child_exit).
+    Перенесенные файлы перечисляются в EXITED до их удаления, поэтому 
+    одновременное чтение не учитывает их дважды
+    """
+    exited = _read( os.path.join( directory, EXITED ) ) or { 'values': {}, 'merged': [] }
+    paths = glob.glob( os.path.join( directory, 'metrics-%d-*.json' % pid ) )
+
+    for path in paths:
+        values = _read( path )
+        if values is not None:
+            _add( exited['values'], values )
+
+    names = [ os.path.basename(path) for path in paths ]
+    exited['merged'] = [ name for name in exited['merged'] if os.path.exists( os.path.join(directory, name) ) ] + names
+    _write( os.path.join( directory, EXITED ), json.dumps( exited, ensure_ascii = False ) )
+
+    for path in paths:
+        os.remove( path )
+
+def clear( directory ):
+    """ Удаляет метрики всех процессов: вызывается при запуске службы
+    (мастером gunicorn, on_starting), чтобы не учитывать прошлые запуски
+    """
+    for path in glob.glob( os.path.join( directory, 'metrics-*.json*' ) ):
+        try:
+            os.remove( path )
+        except OSError:
+            pass
+
+class Registry:
+    """ Метрики одного процесса. Значения хранятся в памяти и не чаще раза
+    в flush_interval секунд записываются в файл процесса в каталоге
+    directory; при чтении значения файлов всех процессов суммируются.
+    После fork дочерний процесс начинает свои метрики с нуля
+    """
+    def __init__( self, directory, flush_interval ):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        os.makedirs( directory, exist_ok = True )
+        self._reset()
+        atexit.register( self.flush, True )
+
+    def _reset( self ):
+        self.pid = os.getpid()
+        self.path = os.path.join( self.directory, 'metrics-%d-%d.json' % (self.pid, time.time_ns()) )
+        self.values = {}
+        self.flushed = 0.0
+
+    def _values( self ):
+        if self.pid != os.getpid():
+            self._reset()
+        return self.values
+
+    @staticmethod
+    def key( name, labels ):
+        return json.dumps( [ name, sorted( labels.items() ) ], ensure_ascii = False )
+
+    def inc( self, name, labels, value = 1 ):
+        key = self.key( name, labels )
+        with self.lock:
+            values = self._values()
+            values[key] = values.get( key, 0 ) + value
+
+    def observe( self, name, labels, value ):
+        """ Наблюдение value гистограммы name: [счетчики корзин..., сумма, количество]
+        """
+        buckets = METRICS[name][2]
+        key = self.key( name, labels )
+        with self.lock:
+            item = self._values().setdefault( key, [0] * (len(buckets) + 3) )
+            item[ next( (i for i, bound in enumerate(buckets) if value <= bound), len(buckets) ) ] += 1
+            item[-2] += value
+            item[-1] += 1
+
+    def flush( self, force = False ):
+        with self.lock:
+            if self.pid != os.getpid() or not force and time.time() - self.flushed < self.flush_interval:
+                return
+            data = json.dumps( self.values, ensure_ascii = False )
+            self.flushed = time.time()
+
+        # Ошибка записи не должна прерывать обработку запроса
+        try:
+            _write( self.path, data )
+        except OSError:
+            pass
+
+    def collect( self ):
+        """ Сумма метрик всех процессов, в том числе завершившихся
+        """
+        self.flush( force = True )
+
+        paths = glob.glob( os.path.join( self.directory, 'metrics-*.json' ) )
+        exited = _read( os.path.join( self.directory, EXITED ) ) or { 'values': {}, 'merged': [] }
+        skip = set( exited['merged'] ) | { EXITED }
+
+        total = {}
+        _add( total, exited['values'] )
+        for path in paths:
+            values = None if os.path.basename(path) in skip else _read( path )
+            if values is not None:
+                _add( total, values )
+        return total
+
+    def render( self ):
+        """ Метрики в текстовом формате Prometheus
+        """
+        samples = {}
+        for key, value in self.collect().items():
+            name, labels = json.loads( key )
+            samples.setdefault( name, [] ).append( ( labels, value ) )
+
+        lines = []
+        for name, ( kind, description, buckets ) in METRICS.items():
+            lines.append( '# HELP %s %s' % (name, description) )
+            lines.append( '# TYPE %s %s' % (name, kind) )
+
+            for labels, value in sorted( samples.get( name, [] ) ):
+                if kind == 'counter':
+                    lines.append( '%s%s %s' % (name, _labels(labels), _number(value)) )
+                    continue
+
+                cumulative = 0
+                for bound, count in zip( list(buckets) + [ '+Inf' ], value ):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _number( bound )
+                    lines.append( '%s_bucket%s %d' % (name, _labels( labels + [[ 'le', le ]] ), cumulative) )
+                lines.append( '%s_sum%s %s' % (name, _labels(labels), _number(value[-2])) )
+                lines.append( '%s_count%s %d' % (name, _labels(labels), value[-1]) )
+
+        return '\n'.join( lines ) + '\n'
+
+def _labels( labels ):
+    if not labels:
+        return ''
+    escape = lambda value: str(value).replace( '\\', '\\\\' ).replace( '"', '\\"' ).replace( '\n', '\\n' )
+    return '{%s}' % ','.join( '%s="%s"' % (name, escape(value)) for name, value in labels )
+
+def _number( value ):
+    return repr( float(value) ) if isinstance( value, float ) and not value.is_integer() else str( int(value) )
+
+def registry():
+    """ Метрики текущего приложения или None, если они отключены
+    """
+    if not has_app_context():
+        return None
+    return current_app.extensions.get( 'metrics' )
+
+def inc( name, labels, value = 1 ):
+    metrics = registry()
+    if metrics is not None:
+        metrics.inc( name, labels, value )
+
+def observe( name, labels, value ):
+    metrics = registry()
+    if metrics is not None:
+        metrics.observe( name, labels, value )
+
+def route():
+    """ Шаблон адреса текущего запроса: метка с ограниченным числом значений
+    """
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def _start():
+    g.metrics_start = perf_counter()
+
+def _finish( response ):
+    metrics, endpoint = current_app.extensions['metrics'], route()
+
+    metrics.inc( 'http_requests_total', { 'route': endpoint, 'method': request.method, 'status': response.status_code } )
+    metrics.observe( 'http_request_duration_seconds', { 'route': endpoint }, perf_counter() - g.pop( 'metrics_start', perf_counter() ) )
+    metrics.observe( 'http_request_size_bytes', { 'route': endpoint }, request.content_length or 0 )
+
+    if response.is_streamed:
+        response.response = _count( response.response, metrics, endpoint )
+    else:
+        metrics.observe( 'http_response_size_bytes', { 'route': endpoint }, response.content_length or 0 )
+        metrics.flush()
+    return response
+
+def _count( chunks, metrics, endpoint ):
+    """ Размер потокового ответа учитывается после его передачи
+    """
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+
+    metrics.observe( 'http_response_size_bytes', { 'route': endpoint }, size )
+    metrics.flush()
+
+def _timed_connect( metrics, connect ):
+    def wrapper():
+        start = perf_counter()
+        try:
+            return connect()
+        finally:
+            metrics.observe( 'db_pool_checkout_seconds', {}, perf_counter() - start )
+    return wrapper
+
+def init_app( app, db ):
+    """ Метрики запросов (METRICS) для GET /metrics, общие для всех
+    рабочих процессов с одним каталогом METRICS_DIR
+    """
+    if not app.config['METRICS']:
+        return
+
+    metrics = Registry( app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'] )
+    app.extensions['metrics'] = metrics
+
+    pool = db.get_engine( app ).pool
+    pool.connect = _timed_connect( metrics, pool.connect )
+
+    app.before_request( _start )
+    app.after_request( _finish )
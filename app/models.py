@@ -1,59 +1,408 @@
-import pickle
+from sqlalchemy import and_
 from . import db
-from sqlalchemy import text
-from datetime import datetime
+from datetime import date, datetime
+from .validation import parse_date
+
+# Ограничение числа параметров запроса SQLite
+CHUNK = 500
 
 class Import( db.Model ):
     __tablename__ = 'imports'
     id        = db.Column( db.Integer, primary_key = True )
+    # Версия данных выгрузки, увеличивается при каждом изменении жителей
+    version   = db.Column( db.Integer, nullable = False, default = 1, server_default = '1' )
     citizens  = db.relationship('Citizen', backref='citizen', lazy='dynamic')
 
     def __repr__( self ):
         return '<Import %r>' % self.id
 
     @staticmethod
-    def get_index():
-        query = text('SELECT * FROM imports ORDER BY id DESC LIMIT 1')
-        result = db.engine.execute(query).fetchone()
-        return 1 if result is None else result['id'] + 1 
+    def create():
+        """ Создает запись о выгрузке в текущей транзакции. Идентификатор 
+        выдается базой данных (автоинкремент первичного ключа), поэтому 
+        параллельные загрузки всегда получают разные import_id
+        """
+        new_import = Import()
+        db.session.add( new_import )
+        db.session.flush()
+        return new_import.id
+
+    @staticmethod
+    def get_version( import_id ):
+        """ Текущая версия выгрузки или None, если выгрузки нет
+        """
+        return db.session.query( Import.version ).filter( Import.id == import_id ).scalar()
+
+    @staticmethod
+    def bump_version( import_id ):
+        """ Увеличивает версию выгрузки в текущей транзакции
+        """
+        Import.query.filter_by( id = import_id ).\
+                     update( { Import.version: Import.version + 1 }, synchronize_session = False )
+
+class ImportJob( db.Model ):
+    """ Фоновая загрузка выгрузки: статус queued -> validating -> saving
+    -> done (import_id) или failed (error). Хранится в базе данных, 
+    поэтому статус доступен всем рабочим процессам сервера. owner - 
+    процесс, выполняющий задачу (host:pid:время запуска процесса)
+    """
+    __tablename__ = 'import_jobs'
+    id        = db.Column( db.Integer,    primary_key = True )
+    status    = db.Column( db.String(16), nullable = False, default = 'queued' )
+    citizens  = db.Column( db.Integer,    nullable = False )
+    import_id = db.Column( db.Integer,    db.ForeignKey('imports.id') )
+    error     = db.Column( db.String(256) )
+    created   = db.Column( db.DateTime,   nullable = False, default = datetime.utcnow )
+    finished  = db.Column( db.DateTime )
+    owner     = db.Column( db.String(128) )
+
+    def __repr__( self ):
+        return '<ImportJob %r: %r>' % (self.id, self.status)
+
+    @staticmethod
+    def create( citizens, owner = None ):
+        """ Создает и фиксирует задачу на загрузку citizens жителей
+        """
+        job = ImportJob( citizens = citizens, owner = owner )
+        db.session.add( job )
+        db.session.commit()
+        return job.id
+
+    @staticmethod
+    def set_status( job_id, status, import_id = None, error = None ):
+        """ Изменяет статус задачи отдельной транзакцией
+        """
+        values = { 'status': status, 'import_id': import_id, 'error': error }
+        if status in ('done', 'failed'):
+            values['finished'] = datetime.utcnow()
+
+        ImportJob.query.filter_by( id = job_id ).update( values, synchronize_session = False )
+        db.session.commit()
+
+    def to_json( self ):
+        json_job = { 'job_id': self.id, 'status': self.status, 'citizens': self.citizens }
+        if self.import_id is not None:
+            json_job['import_id'] = self.import_id
+        if self.error is not None:
+            json_job['error'] = self.error
+        return json_job
 
 class Citizen( db.Model ):
     __tablename__ = 'citizens'
     id         = db.Column( db.Integer,     primary_key = True)
     import_id  = db.Column( db.Integer,     db.ForeignKey('imports.id'), nullable = False )
-    citizen_id = db.Column( db.Integer,     nullable = False, index = True )
+    citizen_id = db.Column( db.Integer,     nullable = False )
 
     town       = db.Column( db.String(256), nullable = False ) 
     street     = db.Column( db.String(256), nullable = False ) 
     building   = db.Column( db.String(256), nullable = False ) 
     apartment  = db.Column( db.Integer,     nullable = False ) 
     name       = db.Column( db.String(256), nullable = False ) 
-    birth_date = db.Column( db.String(10),  nullable = False )
+    birth_date = db.Column( db.Date,        nullable = False )
     gender     = db.Column( db.String(10),  nullable = False )
-    relatives  = db.Column( db.PickleType() )
+
+    # Месяц и день рождения, заполняются вместе с birth_date
+    birth_month = db.Column( db.SmallInteger, nullable = False )
+    birth_day   = db.Column( db.SmallInteger, nullable = False )
+
+    # Поля жителя в ответах API (кроме relatives)
+    FIELDS = ( 'citizen_id', 'town', 'street', 'building', 'apartment', 'name', 'birth_date', 'gender' )
+
+    __table_args__ = (
+        db.Index( 'ix_citizens_import_id_birth_month_birth_day', 'import_id', 'birth_month', 'birth_day' ),
+        # Житель выгрузки ищется по паре (import_id, citizen_id), она уникальна
+        db.Index( 'ix_citizens_import_id_citizen_id', 'import_id', 'citizen_id', unique = True ),
+        # Покрывающий индекс для статистики по городам (town, birth_date)
+        db.Index( 'ix_citizens_import_id_town', 'import_id', 'town', 'birth_date' ),
+    )
 
     def __repr__( self ):
-        return '<Citizen id %r: import_id: %r, citizen_id: %r, %r, %r, %r, %r, %r, %r, %r, %r>' % (self.id, self.import_id, self.citizen_id, \
-                self.town, self.street, self.building, self.apartment, self.name, self.birth_date, self.gender, pickle.loads(self.relatives))
+        return '<Citizen id %r: import_id: %r, citizen_id: %r, %r, %r, %r, %r, %r, %r, %r>' % (self.id, self.import_id, self.citizen_id, \
+                self.town, self.street, self.building, self.apartment, self.name, self.birth_date, self.gender)
 
     def get_age( self ):
-        today = datetime.today()
-        born = datetime.strptime(self.birth_date, '%d.%m.%Y')
-        return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+        today = date.today()
+        return today.year - self.birth_date.year - ((today.month, today.day) < (self.birth_month, self.birth_day))
 
     def get_month_birth( self ):
-        return str(datetime.strptime(self.birth_date, '%d.%m.%Y').month)
+        return str(self.birth_month)
 
-    def to_json( self ):
-        json_citizen = {
-            'citizen_id': self.citizen_id,
-            'town':       self.town,
-            'street':     self.street,
-            'building':   self.building,
-            'apartment':  self.apartment,
-            'name':       self.name,
-            'birth_date': self.birth_date,
-            'gender':     self.gender,
-            'relatives':  pickle.loads(self.relatives)
-        }
-        return json_citizen
\ No newline at end of file
+    def set_birth_date( self, born ):
+        self.birth_date  = born
+        self.birth_month = born.month
+        self.birth_day   = born.day
+
+    @staticmethod
+    def birth_columns( value ):
+        """ Значения столбцов даты рождения для строки DD.MM.YYYY
+        """
+        born = parse_date(value)
+        return { 'birth_date': born, 'birth_month': born.month, 'birth_day': born.day }
+
+    @staticmethod
+    def make_rows( citizens ):
+        """ Строки таблицы citizens (без import_id) для жителей выгрузки
+        """
+        rows = []
+        for citizen in citizens:
+            row = { k: v for k, v in citizen.items() if k != 'relatives' }
+            row.update( Citizen.birth_columns( citizen['birth_date'] ) )
+            rows.append( row )
+        return rows
+
+    @staticmethod
+    def insert_rows( import_id, rows, batch_size ):
+        """ Сохраняет строки make_rows в выгрузку import_id пакетными
+        INSERT-запросами (executemany) в обход ORM
+        """
+        for row in rows:
+            row['import_id'] = import_id
+
+        for i in range( 0, len(rows), batch_size ):
+            db.session.execute( Citizen.__table__.insert(), rows[i:i + batch_size] )
+
+    @staticmethod
+    def insert_many( import_id, citizens, batch_size ):
+        """ Сохраняет жителей выгрузки import_id пакетными
+        INSERT-запросами (executemany) в обход ORM
+        """
+        Citizen.insert_rows( import_id, Citizen.make_rows( citizens ), batch_size )
+
+    @staticmethod
+    def get_page( import_id, after, limit, fields = FIELDS ):
+        """ Не более limit жителей выгрузки import_id с citizen_id больше 
+        after в порядке citizen_id (по индексу, без OFFSET). Читаются
+        только столбцы fields и citizen_id
+        """
+        columns = [ getattr(Citizen, field) for field in fields if field != 'citizen_id' ]
+        return db.session.query( Citizen.citizen_id, *columns ).\
+                          filter( Citizen.import_id == import_id, Citizen.citizen_id > after ).\
+                          order_by( Citizen.citizen_id ).limit( limit ).all()
+
+    @staticmethod
+    def get_many( import_id, citizen_ids ):
+        """ Словарь citizen_id -> Citizen для жителей citizen_ids 
+        выгрузки import_id (отсутствующих жителей в нем нет)
+        """
+        citizen_ids, citizens = sorted( set(citizen_ids) ), {}
+        for i in range( 0, len(citizen_ids), CHUNK ):
+            query = Citizen.query.filter( Citizen.import_id == import_id,
+                                          Citizen.citizen_id.in_( citizen_ids[i:i + CHUNK] ) )
+            citizens.update( (citizen.citizen_id, citizen) for citizen in query )
+        return citizens
+
+    @staticmethod
+    def get_ids( import_id, citizen_ids ):
+        """ Множество тех citizen_ids, которые есть в выгрузке import_id
+        """
+        citizen_ids, found = sorted( set(citizen_ids) ), set()
+        for i in range( 0, len(citizen_ids), CHUNK ):
+            query = db.session.query( Citizen.citizen_id ).\
+                               filter( Citizen.import_id == import_id,
+                                       Citizen.citizen_id.in_( citizen_ids[i:i + CHUNK] ) )
+            found.update( citizen_id for citizen_id, in query )
+        return found
+
+    @staticmethod
+    def row_to_json( row, relatives, fields = FIELDS ):
+        """ Представление жителя в формате API по объекту Citizen 
+        или строке запроса со столбцами fields. Поле relatives 
+        не выводится, если relatives = None
+        """
+        json_citizen = { field: getattr(row, field) for field in fields if field != 'relatives' }
+        if 'birth_date' in json_citizen:
+            json_citizen['birth_date'] = Citizen.format_birth_date( row.birth_date )
+        if relatives is not None:
+            json_citizen['relatives'] = relatives
+        return json_citizen
+
+    @staticmethod
+    def format_birth_date( born ):
+        return '%02d.%02d.%04d' % (born.day, born.month, born.year)
+
+    def to_json( self, relatives ):
+        return Citizen.row_to_json( self, relatives )
+
+class Relative( db.Model ):
+    """ Родственная связь: житель citizen_id выгрузки import_id 
+    является родственником жителя relative_id. Порядок связей 
+    жителя определяется первичным ключом id.
+    """
+    __tablename__ = 'relatives'
+    id          = db.Column( db.Integer, primary_key = True )
+    import_id   = db.Column( db.Integer, db.ForeignKey('imports.id'), nullable = False )
+    citizen_id  = db.Column( db.Integer, nullable = False )
+    relative_id = db.Column( db.Integer, nullable = False )
+
+    __table_args__ = (
+        db.Index( 'ix_relatives_import_id_citizen_id', 'import_id', 'citizen_id' ),
+        db.Index( 'ix_relatives_import_id_relative_id', 'import_id', 'relative_id' ),
+    )
+
+    def __repr__( self ):
+        return '<Relative import_id: %r, %r -> %r>' % (self.import_id, self.citizen_id, self.relative_id)
+
+    @staticmethod
+    def insert_many( import_id, citizens, batch_size ):
+        """ Сохраняет родственные связи жителей выгрузки import_id 
+        пакетными INSERT-запросами (executemany)
+        """
+        rows = [ { 'import_id': import_id, 'citizen_id': citizen['citizen_id'], 'relative_id': rel_id }
+                 for citizen in citizens for rel_id in citizen['relatives'] ]
+
+        for i in range( 0, len(rows), batch_size ):
+            db.session.execute( Relative.__table__.insert(), rows[i:i + batch_size] )
+
+    @staticmethod
+    def get_map( import_id, first = None, last = None ):
+        """ Возвращает словарь citizen_id -> [relative_id, ...] 
+        для всех жителей выгрузки import_id (или жителей с citizen_id 
+        от first до last включительно) одним запросом
+        """
+        query = db.session.query( Relative.citizen_id, Relative.relative_id ).\
+                           filter( Relative.import_id == import_id ).order_by( Relative.id )
+
+        if first is not None:
+            query = query.filter( Relative.citizen_id.between( first, last ) )
+
+        relatives = {}
+        for citizen_id, rel_id in query:
+            relatives.setdefault( citizen_id, [] ).append( rel_id )
+        return relatives
+
+    @staticmethod
+    def get_rows( import_id, citizen_ids ):
+        """ Связи (id, citizen_id, relative_id) жителей citizen_ids 
+        выгрузки import_id в порядке id
+        """
+        citizen_ids, rows = sorted( set(citizen_ids) ), []
+        for i in range( 0, len(citizen_ids), CHUNK ):
+            rows.extend( db.session.query( Relative.id, Relative.citizen_id, Relative.relative_id ).\
+                                    filter( Relative.import_id == import_id,
+                                            Relative.citizen_id.in_( citizen_ids[i:i + CHUNK] ) ) )
+        return sorted( rows )
+
+    @staticmethod
+    def delete_many( ids ):
+        """ Удаляет связи с первичными ключами ids
+        """
+        ids = sorted( ids )
+        for i in range( 0, len(ids), CHUNK ):
+            Relative.query.filter( Relative.id.in_( ids[i:i + CHUNK] ) ).delete( synchronize_session = False )
+
+    @staticmethod
+    def get_linked( import_id, citizen_ids, relative_id ):
+        """ Множество тех citizen_ids, у которых есть связь с relative_id
+        """
+        citizen_ids, linked = sorted( set(citizen_ids) ), set()
+        for i in range( 0, len(citizen_ids), CHUNK ):
+            query = db.session.query( Relative.citizen_id ).\
+                               filter( Relative.import_id == import_id, Relative.relative_id == relative_id,
+                                       Relative.citizen_id.in_( citizen_ids[i:i + CHUNK] ) )
+            linked.update( citizen_id for citizen_id, in query )
+        return linked
+
+    @staticmethod
+    def delete_links( import_id, citizen_ids, relative_id ):
+        """ Удаляет связи жителей citizen_ids с relative_id, в том числе
+        повторяющиеся
+        """
+        citizen_ids = sorted( set(citizen_ids) )
+        for i in range( 0, len(citizen_ids), CHUNK ):
+            Relative.query.filter( Relative.import_id == import_id, Relative.relative_id == relative_id,
+                                   Relative.citizen_id.in_( citizen_ids[i:i + CHUNK] ) ).\
+                           delete( synchronize_session = False )
+
+    @staticmethod
+    def get_list( import_id, citizen_id ):
+        """ Возвращает список родственников жителя citizen_id выгрузки import_id
+        """
+        query = db.session.query( Relative.relative_id ).\
+                           filter_by( import_id = import_id, citizen_id = citizen_id ).order_by( Relative.id )
+        return [ rel_id for rel_id, in query ]
+
+class Present( db.Model ):
+    """ Подарки: житель citizen_id выгрузки import_id покупает presents 
+    подарков родственникам, родившимся в месяце month. Таблица заполняется
+    при загрузке и пересчитывается для затронутых жителей при изменении.
+
+    Порядок жителей внутри месяца - порядок первого появления в выгрузке: 
+    по первичным ключам (first_citizen, first_relative) самой ранней пары 
+    родственник (Citizen.id) - связь (Relative.id)
+    """
+    __tablename__ = 'presents'
+    id             = db.Column( db.Integer,      primary_key = True )
+    import_id      = db.Column( db.Integer,      db.ForeignKey('imports.id'), nullable = False )
+    month          = db.Column( db.SmallInteger, nullable = False )
+    citizen_id     = db.Column( db.Integer,      nullable = False )
+    presents       = db.Column( db.Integer,      nullable = False )
+    first_citizen  = db.Column( db.Integer,      nullable = False )
+    first_relative = db.Column( db.Integer,      nullable = False )
+
+    __table_args__ = (
+        db.Index( 'ix_presents_import_id_month', 'import_id', 'month', 'first_citizen', 'first_relative' ),
+        db.Index( 'ix_presents_import_id_citizen_id', 'import_id', 'citizen_id' ),
+    )
+
+    def __repr__( self ):
+        return '<Present import_id: %r, month: %r, citizen_id: %r, presents: %r>' % \
+                (self.import_id, self.month, self.citizen_id, self.presents)
+
+    @staticmethod
+    def rebuild( import_id, citizen_ids = None, batch_size = 5000 ):
+        """ Пересчитывает подарки жителей citizen_ids выгрузки import_id
+        (всех жителей, если citizen_ids не задан) в текущей транзакции
+        """
+        if citizen_ids is None:
+            Present._rebuild( import_id, None, batch_size )
+            return
+
+        citizen_ids = sorted( set(citizen_ids) )
+        for i in range( 0, len(citizen_ids), CHUNK ):
+            Present._rebuild( import_id, citizen_ids[i:i + CHUNK], batch_size )
+
+    @staticmethod
+    def _rebuild( import_id, citizen_ids, batch_size ):
+        query = db.session.query( Citizen.birth_month, Relative.relative_id, Citizen.id, Relative.id ).\
+                           join( Relative, and_( Relative.import_id == Citizen.import_id,
+                                                 Relative.citizen_id == Citizen.citizen_id ) ).\
+                           filter( Citizen.import_id == import_id )
+        delete = Present.query.filter_by( import_id = import_id )
+
+        if citizen_ids is not None:
+            query = query.filter( Relative.relative_id.in_(citizen_ids) )
+            delete = delete.filter( Present.citizen_id.in_(citizen_ids) )
+
+        delete.delete( synchronize_session = False )
+
+        # (month, citizen_id) -> [presents, (first_citizen, first_relative)]
+        presents = {}
+        for month, citizen_id, first_citizen, first_relative in query:
+            first = ( first_citizen, first_relative )
+            item = presents.get( (month, citizen_id) )
+            if item is None:
+                presents[(month, citizen_id)] = [ 1, first ]
+            else:
+                item[0] += 1
+                item[1] = min( item[1], first )
+
+        rows = [ { 'import_id': import_id, 'month': month, 'citizen_id': citizen_id, 'presents': count,
+                   'first_citizen': first[0], 'first_relative': first[1] }
+                 for (month, citizen_id), (count, first) in presents.items() ]
+
+        for i in range( 0, len(rows), batch_size ):
+            db.session.execute( Present.__table__.insert(), rows[i:i + batch_size] )
+
+    @staticmethod
+    def get_months( import_id ):
+        """ Возвращает словарь month -> [(citizen_id, presents), ...]
+        для всех месяцев года одним запросом по индексу
+        """
+        query = db.session.query( Present.month, Present.citizen_id, Present.presents ).\
+                           filter( Present.import_id == import_id ).\
+                           order_by( Present.month, Present.first_citizen, Present.first_relative )
+
+        months = dict( (month, []) for month in range(1,13) )
+        for month, citizen_id, presents in query:
+            months[month].append( (citizen_id, presents) )
+        return months
@@ -0,0 +1,61 @@
+from time import perf_counter
+from flask import g, request, current_app, has_app_context
+from sqlalchemy import event
+
+def record( name, elapsed, count = 1 ):
+    """ Добавляет время elapsed (секунды) к показателю name текущего
+    запроса. Вне профилируемого запроса ничего не делает
+    """
+    if not has_app_context():
+        return
+
+    timings = g.get( 'timings' )
+    if timings is not None:
+        total, number = timings.get( name, (0.0, 0) )
+        timings[name] = ( total + elapsed, number + count )
+
+def _before_cursor_execute( conn, cursor, statement, parameters, context, executemany ):
+    conn.info.setdefault( 'query_start', [] ).append( perf_counter() )
+
+def _after_cursor_execute( conn, cursor, statement, parameters, context, executemany ):
+    record( 'db', perf_counter() - conn.info['query_start'].pop() )
+
+def _start():
+    g.timings = {}
+    g.request_start = perf_counter()
+
+def _finish( response ):
+    timings = g.pop( 'timings', None )
+    if timings is None:
+        return response
+
+    total = perf_counter() - g.pop( 'request_start' )
+    db_time, queries = timings.get( 'db', (0.0, 0) )
+
+    metrics = [ 'app;dur=%.1f' % (total * 1000), 'db;desc="%d queries";dur=%.1f' % (queries, db_time * 1000) ]
+    for name in ('serialize', 'parse'):
+        if name in timings:
+            metrics.append( '%s;dur=%.1f' % (name, timings[name][0] * 1000) )
+    response.headers['Server-Timing'] = ', '.join( metrics )
+
+    if total >= current_app.config['SLOW_REQUEST_THRESHOLD']:
+        current_app.logger.warning( 'Slow request %s %s: %d, %.1f ms, %d queries %.1f ms, serialize %.1f ms',
+                                    request.method, request.full_path.rstrip('?'), response.status_code,
+                                    total * 1000, queries, db_time * 1000, timings.get( 'serialize', (0.0, 0) )[0] * 1000 )
+    return response
+
+def init_app( app, db ):
+    """ Профилирование запросов (PROFILING): время обработки, количество
+    и время SQL-запросов, время кодирования JSON - в заголовке ответа
+    Server-Timing и в журнале для запросов дольше SLOW_REQUEST_THRESHOLD.
+    Для потоковых ответов учитывается только время до начала передачи
+    """
+    if not app.config['PROFILING']:
+        return
+
+    engine = db.get_engine( app )
+    event.listen( engine, 'before_cursor_execute', _before_cursor_execute )
+    event.listen( engine, 'after_cursor_execute', _after_cursor_execute )
+
+    app.before_request( _start )
+    app.after_request( _finish )
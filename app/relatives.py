@@ -1,56 +1,134 @@
-import pickle
+from . import db
 from flask import abort
-from .models import Citizen
+from .models import Citizen, Relative
 
-def set_relatives( import_id ):
-    """ Устанавливаем родство среди граждан выгрузки import_id,
-    если оно не указано.
+def set_relatives( citizens ):
+    """ Устанавливаем родство среди граждан выгрузки, если оно 
+    не указано. Списки relatives дополняются на месте за один проход 
+    по данным запроса, до записи выгрузки в базу данных.
 
     view function -> ('/imports', methods = ['POST'])
     """
-    import_citizens = Citizen.query.filter_by( import_id = import_id ).all()
-    
-    for citizen in import_citizens:
-        for rel_id in pickle.loads(citizen.relatives):
-            
-            relative = Citizen.query.filter_by( citizen_id = rel_id, import_id = import_id ).first()
-            if relative is None:
+    index = { citizen['citizen_id']: citizen['relatives'] for citizen in citizens }
+    known = { citizen_id: set(relatives) for citizen_id, relatives in index.items() }
+
+    for citizen in citizens:
+        citizen_id = citizen['citizen_id']
+
+        for rel_id in citizen['relatives']:
+            if not rel_id in index:
                 abort(400)
 
-            relatives = pickle.loads(relative.relatives)
-            
-            if not citizen.citizen_id in relatives:
-                relatives.append(citizen.citizen_id)
-                relative.relatives = pickle.dumps(relatives)
+            if not citizen_id in known[rel_id]:
+                index[rel_id].append(citizen_id)
+                known[rel_id].add(citizen_id)
+
+def _without_common( values, common ):
+    """ values без первого вхождения каждого из значений common
+    """
+    pending, rest = set(common), []
+    for value in values:
+        if value in pending:
+            pending.discard(value)
+        else:
+            rest.append(value)
+    return rest
 
 def new_relatives( import_id, citizen_id, old_rel, new_rel ):
     """ Устанваливаем новое родство горожанину citizen_id при обновлении 
-    данных выгрузки import_id, если потребуется.
+    данных выгрузки import_id, если потребуется. Число запросов не зависит
+    от числа родственников: связи проверяются и записываются пакетно.
 
     view function -> ('/imports/<int:import_id>/citizens', methods = ['PATCH']) 
     """
     if old_rel == new_rel:
         return
 
-    del_rel = set(old_rel) & set(new_rel)
+    common = set(old_rel) & set(new_rel)
+    old_rel, new_rest = _without_common( old_rel, common ), _without_common( new_rel, common )
+
+    if set(new_rest) - Citizen.get_ids( import_id, new_rest ):
+        db.session.rollback()
+        abort(400)
+
+    Relative.query.filter_by( import_id = import_id, citizen_id = citizen_id ).delete()
+    rows = [ { 'import_id': import_id, 'citizen_id': citizen_id, 'relative_id': rel_id } for rel_id in new_rel ]
+
+    Relative.delete_links( import_id, old_rel, citizen_id )
+
+    # Обратные связи - только тем новым родственникам, у которых их нет
+    linked = Relative.get_linked( import_id, new_rest, citizen_id )
+    for rel_id in new_rest:
+        if rel_id not in linked:
+            linked.add( rel_id )
+            rows.append( { 'import_id': import_id, 'citizen_id': rel_id, 'relative_id': citizen_id } )
+
+    if rows:
+        db.session.execute( Relative.__table__.insert(), rows )
+
+def update_relatives( import_id, updates, batch_size ):
+    """ Применяет по порядку изменения родства updates = [(citizen_id, 
+    relatives), ...] (relatives = None - родство жителя не меняется) так же,
+    как последовательные вызовы new_relatives. Граф связей затронутых 
+    жителей читается и записывается пакетными запросами, изменения
+    выполняются в памяти. Возвращает словарь citizen_id -> [relative_id, ...]
+    после изменений для жителей updates и множество жителей, подарки 
+    которых нужно пересчитать.
+
+    view function -> ('/imports/<int:import_id>/citizens', methods = ['PATCH'])
+    """
+    changed = [ (citizen_id, relatives) for citizen_id, relatives in updates if relatives is not None ]
+    mentioned = { rel_id for _, relatives in changed for rel_id in relatives }
+    if mentioned - Citizen.get_ids( import_id, mentioned ):
+        db.session.rollback()
+        abort(400)
+
+    # citizen_id -> [(id, порядковый номер новой связи, relative_id), ...]:
+    # у существующих связей известен id, новые получат id в порядке создания
+    links = {}
+    def load( citizen_ids ):
+        citizen_ids = set(citizen_ids) - links.keys()
+        for citizen_id in citizen_ids:
+            links[citizen_id] = []
+        for row_id, citizen_id, rel_id in Relative.get_rows( import_id, citizen_ids ):
+            links[citizen_id].append( (row_id, 0, rel_id) )
+
+    load( { citizen_id for citizen_id, _ in updates } | mentioned )
+    load( rel_id for citizen_id, _ in changed for _, _, rel_id in links[citizen_id] )
+    existing = { link[0] for citizen_links in links.values() for link in citizen_links }
+
+    created, affected = 0, set()
+    def link( rel_id ):
+        nonlocal created
+        created += 1
+        return ( None, created, rel_id )
+
+    for citizen_id, relatives in changed:
+        old_rel = [ rel_id for _, _, rel_id in links[citizen_id] ]
+        if old_rel == relatives:
+            continue
+
+        affected.add( citizen_id )
+        affected.update( old_rel, relatives )
+        links[citizen_id] = [ link(rel_id) for rel_id in relatives ]
+
+        common = set(old_rel) & set(relatives)
+        old_rel, new_rel = _without_common( old_rel, common ), _without_common( relatives, common )
 
-    for el in del_rel:
-        old_rel.pop( old_rel.index(el) )
-        new_rel.pop( new_rel.index(el) )
+        for rel_id in set(old_rel):
+            links[rel_id] = [ item for item in links[rel_id] if item[2] != citizen_id ]
 
-    for rel_id in old_rel:
-        relative = Citizen.query.filter_by( citizen_id = rel_id, import_id = import_id ).first()
-        relatives = pickle.loads(relative.relatives)
+        for rel_id in new_rel:
+            if not any( item[2] == citizen_id for item in links[rel_id] ):
+                links[rel_id].append( link(citizen_id) )
 
-        if citizen_id in relatives:
-            relatives.pop( relatives.index(citizen_id) )
-            relative.relatives = pickle.dumps(relatives)
+    kept = { item[0] for citizen_links in links.values() for item in citizen_links }
+    Relative.delete_many( existing - kept )
 
-    for rel_id in new_rel:
-        relative = Citizen.query.filter_by( citizen_id = rel_id, import_id = import_id ).first()
-        if relative is None: abort(400)
-        relatives = pickle.loads(relative.relatives)
+    rows = sorted( ( item[1], citizen_id, item[2] ) for citizen_id, citizen_links in links.items()
+                   for item in citizen_links if item[0] is None )
+    rows = [ { 'import_id': import_id, 'citizen_id': citizen_id, 'relative_id': rel_id } for _, citizen_id, rel_id in rows ]
+    for i in range( 0, len(rows), batch_size ):
+        db.session.execute( Relative.__table__.insert(), rows[i:i + batch_size] )
 
-        if not citizen_id in relatives:
-            relatives.append(citizen_id)
-            relative.relatives = pickle.dumps(relatives)
\ No newline at end of file
+    return { citizen_id: [ item[2] for item in links[citizen_id] ] for citizen_id, _ in updates }, affected
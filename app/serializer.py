@@ -0,0 +1,111 @@
+import json
+from time import perf_counter
+from flask import current_app, request, abort
+from . import profiling
+
+class JSONBackend:
+    """ Стандартный модуль json. Порядок ключей и экранирование
+    не-ASCII символов задаются настройками JSON_SORT_KEYS и JSON_AS_ASCII
+    """
+    name = 'json'
+
+    def __init__( self, sort_keys = True, ensure_ascii = True ):
+        self.sort_keys = sort_keys
+        self.ensure_ascii = ensure_ascii
+
+    def dumps( self, obj ):
+        return json.dumps( obj, sort_keys = self.sort_keys, ensure_ascii = self.ensure_ascii,
+                           separators = (',', ':') ).encode('utf-8')
+
+    def loads( self, data ):
+        return json.loads( data )
+
+class UJSONBackend( JSONBackend ):
+    name = 'ujson'
+
+    def __init__( self, sort_keys = True, ensure_ascii = True ):
+        import ujson
+        super().__init__( sort_keys, ensure_ascii )
+        self.ujson = ujson
+
+    def dumps( self, obj ):
+        return self.ujson.dumps( obj, sort_keys = self.sort_keys, ensure_ascii = self.ensure_ascii,
+                                 escape_forward_slashes = False ).encode('utf-8')
+
+    def loads( self, data ):
+        return self.ujson.loads( data )
+
+class ORJSONBackend( JSONBackend ):
+    """ orjson всегда возвращает UTF-8 без экранирования не-ASCII символов
+    """
+    name = 'orjson'
+
+    def __init__( self, sort_keys = True, ensure_ascii = True ):
+        import orjson
+        super().__init__( sort_keys, ensure_ascii )
+        self.orjson = orjson
+        self.option = orjson.OPT_SORT_KEYS if sort_keys else 0
+
+    def dumps( self, obj ):
+        return self.orjson.dumps( obj, option = self.option )
+
+    def loads( self, data ):
+        return self.orjson.loads( data )
+
+BACKENDS = {
+    'orjson': ORJSONBackend,
+    'ujson':  UJSONBackend,
+    'json':   JSONBackend
+}
+
+def get_backend( name = 'auto', sort_keys = True, ensure_ascii = True ):
+    """ Возвращает кодировщик JSON по имени. Для 'auto' выбирается самый
+    быстрый из установленных: orjson, ujson, затем стандартный json
+    """
+    names = list(BACKENDS) if name == 'auto' else [ name ]
+
+    for backend in names:
+        try:
+            return BACKENDS[backend]( sort_keys, ensure_ascii )
+        except ImportError:
+            if name != 'auto':
+                raise
+
+    return JSONBackend( sort_keys, ensure_ascii )
+
+def init_app( app ):
+    app.extensions['json_backend'] = get_backend(
+        app.config['JSON_BACKEND'], app.config['JSON_SORT_KEYS'], app.config['JSON_AS_ASCII']
+    )
+
+def backend():
+    return current_app.extensions['json_backend']
+
+def dumps( obj ):
+    """ Кодирует obj в байты JSON выбранным кодировщиком
+    """
+    start = perf_counter()
+    data = backend().dumps( obj )
+    profiling.record( 'serialize', perf_counter() - start )
+    return data
+
+def json_response( obj, status = 200 ):
+    """ Замена jsonify с кодировщиком из настройки JSON_BACKEND
+    """
+    return current_app.response_class( dumps(obj) + b'\n', status = status,
+                                       mimetype = current_app.config['JSONIFY_MIMETYPE'] )
+
+def request_json():
+    """ Замена request.json: тело запроса с типом application/json,
+    разобранное выбранным кодировщиком, или None
+    """
+    if not request.is_json:
+        return None
+
+    start = perf_counter()
+    try:
+        return backend().loads( request.get_data( cache = True ) )
+    except ValueError:
+        abort(400)
+    finally:
+        profiling.record( 'parse', perf_counter() - start )
@@ -0,0 +1,43 @@
+import numpy as np
+
+def get_ages( birth_dates, today ):
+    """ Возвращает массив возрастов (полных лет) на дату today
+    для массива дат рождения numpy.datetime64[D]
+    """
+    years  = birth_dates.astype('datetime64[Y]')
+    months = birth_dates.astype('datetime64[M]')
+
+    # Номер дня в году в формате MMDD для сравнения с текущей датой
+    born = ( months - years ).astype(int) * 100 + ( birth_dates - months ).astype(int) + 101
+    age = today.year - ( years.astype(int) + 1970 )
+
+    return age - ( today.month * 100 + today.day < born )
+
+def group_percentiles( groups, values, q ):
+    """ Вычисляет перцентили q (method='linear', как numpy.percentile)
+    значений values для каждой группы groups за одну сортировку.
+
+    Возвращает массив уникальных групп и матрицу перцентилей
+    размером (количество групп, len(q))
+    """
+    order = np.lexsort(( values, groups ))
+    groups, values = groups[order], values[order]
+
+    starts = np.flatnonzero( np.r_[ True, groups[1:] != groups[:-1] ] )
+    counts = np.diff( np.r_[ starts, len(groups) ] )
+
+    # Положение перцентиля внутри отсортированной группы
+    virtual = ( counts[:, None] - 1 ) * ( np.asarray(q, dtype = float) / 100 )[None, :]
+    previous = np.floor( virtual ).astype(int)
+    following = np.minimum( previous + 1, counts[:, None] - 1 )
+    gamma = virtual - previous
+
+    a = values[ starts[:, None] + previous ]
+    b = values[ starts[:, None] + following ]
+
+    # Линейная интерполяция в той же форме, что и в numpy.percentile
+    diff = b - a
+    result = a + diff * gamma
+    result = np.where( gamma >= 0.5, b - diff * ( 1 - gamma ), result )
+
+    return groups[starts], result
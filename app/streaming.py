@@ -0,0 +1,170 @@
+import codecs, json
+from sqlalchemy import and_
+from . import db
+from .models import Citizen, Relative
+from .serializer import dumps
+
+def citizens_json( import_id, chunk_size, fields = Citizen.FIELDS + ('relatives',) ):
+    """ Генератор JSON-документа {"data": [...]} со всеми жителями
+    выгрузки import_id. Жители читаются вместе с родственными связями
+    курсором на стороне сервера и отдаются частями по chunk_size жителей,
+    поэтому расход памяти не зависит от размера выгрузки. Читаются и
+    выводятся только поля fields; без relatives связи не читаются.
+
+    view function -> ('/imports/<int:import_id>/citizens', methods = ['GET'])
+    """
+    with_relatives = 'relatives' in fields
+    fields = [ field for field in fields if field != 'relatives' ]
+
+    columns = [ getattr(Citizen, field) for field in fields ]
+    if with_relatives:
+        query = db.session.query( Citizen.id, *columns, Relative.relative_id ).\
+                           outerjoin( Relative, and_( Relative.import_id == Citizen.import_id,
+                                                      Relative.citizen_id == Citizen.citizen_id ) ).\
+                           order_by( Citizen.id, Relative.id )
+    else:
+        query = db.session.query( Citizen.id, *columns ).order_by( Citizen.id )
+
+    query = query.filter( Citizen.import_id == import_id ).\
+                  execution_options( stream_results = True ).\
+                  yield_per( chunk_size )
+
+    def encode( chunk, first ):
+        data = b','.join( dumps( citizen ) for citizen in chunk )
+        return data if first else b',' + data
+
+    yield b'{"data":['
+
+    chunk, first = [], True
+    current, relatives = None, None
+
+    # Строки одного жителя идут подряд: по одной на каждую родственную связь
+    for row in query:
+        if current is None or row.id != current.id:
+            if current is not None:
+                chunk.append( Citizen.row_to_json( current, relatives, fields ) )
+
+            if len(chunk) >= chunk_size:
+                yield encode( chunk, first )
+                chunk, first = [], False
+
+            current, relatives = row, [] if with_relatives else None
+
+        if with_relatives and row.relative_id is not None:
+            relatives.append( row.relative_id )
+
+    if current is not None:
+        chunk.append( Citizen.row_to_json( current, relatives, fields ) )
+    if chunk:
+        yield encode( chunk, first )
+
+    yield b']}\n'
+
+class StreamError( ValueError ):
+    """ Тело запроса не является корректным документом {"citizens": [...]}
+    """
+
+def iter_citizens( stream, max_item_size, read_size = 64 * 1024 ):
+    """ Инкрементальный разбор документа {"citizens": [...]} из потока 
+    байтов stream. Жители возвращаются по одному по мере чтения, 
+    в памяти хранится только текущий элемент массива.
+
+    Исключение StreamError, если документ некорректен, массив citizens 
+    отсутствует или встречен повторно, или отдельный элемент больше 
+    max_item_size символов.
+
+    view function -> ('/imports', methods = ['POST'])
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    state = { 'buffer': '', 'pos': 0, 'eof': False }
+
+    def read():
+        if state['eof']:
+            return False
+        data = stream.read( read_size )
+        try:
+            text = utf8.decode( data, final = not data )
+        except UnicodeDecodeError:
+            raise StreamError('Invalid UTF-8')
+        state['eof'] = not data
+
+        # Прочитанная часть буфера отбрасывается
+        state['buffer'] = state['buffer'][state['pos']:] + text
+        state['pos'] = 0
+        return True
+
+    def peek():
+        """ Первый непробельный символ или '' в конце потока """
+        while True:
+            buffer, pos = state['buffer'], state['pos']
+            while pos < len(buffer) and buffer[pos] in ' \t\n\r':
+                pos += 1
+            state['pos'] = pos
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read():
+                return ''
+
+    def expect( chars ):
+        char = peek()
+        if not char or not char in chars:
+            raise StreamError('Expected %r' % chars)
+        state['pos'] += 1
+        return char
+
+    def value():
+        """ Очередное JSON-значение; буфер дочитывается, пока значение 
+        не будет разобрано целиком """
+        peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode( state['buffer'], state['pos'] )
+                if end - state['pos'] > max_item_size:
+                    raise StreamError('Item is too large')
+                # Число на границе буфера может продолжаться в потоке
+                if end < len(state['buffer']) or state['eof']:
+                    state['pos'] = end
+                    return obj
+            except ValueError:
+                if state['eof']:
+                    raise StreamError('Malformed JSON')
+
+            if len(state['buffer']) - state['pos'] > max_item_size:
+                raise StreamError('Item is too large')
+            read()
+
+    found = False
+    expect('{')
+    if peek() == '}':
+        raise StreamError('Expected "citizens"')
+
+    while True:
+        if peek() != '"':
+            raise StreamError('Expected key')
+        key = value()
+        expect(':')
+
+        if key == 'citizens':
+            if found:
+                raise StreamError('Duplicate "citizens"')
+            found = True
+
+            expect('[')
+            if peek() == ']':
+                state['pos'] += 1
+            else:
+                while True:
+                    yield value()
+                    if expect(',]') == ']':
+                        break
+        else:
+            value()
+
+        if expect(',}') == '}':
+            break
+
+    if peek():
+        raise StreamError('Extra data')
+    if not found:
+        raise StreamError('Expected "citizens"')
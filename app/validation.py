@@ -1,5 +1,6 @@
-import numpy as np
-from datetime import datetime
+import re, threading, numpy as np
+from collections.abc import Sequence
+from datetime import datetime, date
 from cerberus import Validator
 
 def _unique( data ):
@@ -7,6 +8,20 @@ def _unique( data ):
     except KeyError: return False
     return np.unique(citizen_id).size == len(citizen_id)
 
+# Регулярное выражение, которое datetime.strptime строит для '%d.%m.%Y'
+_DATE = re.compile( r'(3[01]|[12]\d|0[1-9]|[1-9]| [1-9])\.(1[0-2]|0[1-9]|[1-9])\.(\d\d\d\d)', re.IGNORECASE )
+
+def parse_date( value ):
+    """ Преобразует дату рождения из формата DD.MM.YYYY. Принимает те же
+    строки, что и datetime.strptime(value, '%d.%m.%Y'), но быстрее
+    """
+    found = _DATE.fullmatch( value )
+    if found is None:
+        raise ValueError('time data %r does not match format %r' % (value, '%d.%m.%Y'))
+
+    day, month, year = found.groups()
+    return date( int(year), int(month), int(day) )
+
 class MyValidator(Validator):
     def _validate_borndate(self, date, field, value):
         """ Проверка даты рождения на корректность.
@@ -16,8 +31,8 @@ class MyValidator(Validator):
         """
         if date:
             try: 
-                born = datetime.strptime(value, '%d.%m.%Y')
-                if born > datetime.today():
+                born = parse_date(value)
+                if born > datetime.today().date():
                     self._error(field, 'Must be less than current date')
             except ValueError: 
                 self._error(field, 'Must be in DD.MM.YYYY format')
@@ -34,7 +49,109 @@ schema = {
     'relatives':  { 'type': 'list',    'schema': {'type': 'integer'} }
 }
 
-cerberus_lite = MyValidator(schema)        
+def parse_fields( value ):
+    """ Поля жителя из параметра запроса fields=a,b,c в порядке схемы. 
+    ValueError, если список пуст или в нем есть поле не из схемы
+    """
+    fields = set( value.split(',') )
+    if not fields <= schema.keys():
+        raise ValueError('Unknown fields: %s' % ', '.join( sorted(fields - schema.keys()) ))
+    return tuple( field for field in schema if field in fields )
+
+class LocalValidator( threading.local ):
+    """ Отдельный экземпляр валидатора для каждого потока: 
+    Validator хранит состояние проверки в своих атрибутах
+    """
+    def __init__( self, *args, **kwargs ):
+        self.validator = MyValidator( *args, **kwargs )
+
+    def validate( self, document ):
+        return self.validator.validate( document )
+
+# Cerberus остается эталонной реализацией проверки для тестов
+cerberus_lite = LocalValidator(schema)        
 
 # Строгая схема, где все поля должны быть заолнены
-cerberus = MyValidator(schema, require_all=True) 
\ No newline at end of file
+cerberus = LocalValidator(schema, require_all=True) 
+
+def _borndate( enabled ):
+    def check( value, today ):
+        try:
+            return parse_date( value ) <= today
+        except ValueError:
+            return False
+    return check if enabled else ( lambda value, today: True )
+
+def _items( rules ):
+    check_item = _compile( rules )
+    return lambda value, today: all( check_item( item, today ) for item in value )
+
+_TYPES = {
+    'integer': lambda value, today: isinstance( value, int ),
+    'string':  lambda value, today: isinstance( value, str ),
+    'list':    lambda value, today: isinstance( value, Sequence ) and not isinstance( value, str )
+}
+
+_RULES = {
+    'min':       lambda arg: lambda value, today: value >= arg,
+    'maxlength': lambda arg: lambda value, today: len(value) <= arg,
+    'empty':     lambda arg: ( lambda value, today: True ) if arg else ( lambda value, today: len(value) > 0 ),
+    'allowed':   lambda arg: lambda value, today: value in arg,
+    'borndate':  _borndate,
+    'schema':    _items
+}
+
+def _compile( rules ):
+    """ Функция проверки значения поля по его правилам схемы Cerberus
+    """
+    rules = dict( rules )
+    nullable = rules.pop( 'nullable', False )
+
+    # Тип проверяется первым: остальные правила рассчитаны на него
+    checks = [ _TYPES[ rules.pop('type') ] ]
+    for rule, arg in rules.items():
+        if rule not in _RULES:
+            raise ValueError('Unsupported rule %r' % rule)
+        checks.append( _RULES[rule]( arg ) )
+    checks = tuple( checks )
+
+    def check( value, today ):
+        if value is None:
+            return nullable
+        for rule in checks:
+            if not rule( value, today ):
+                return False
+        return True
+    return check
+
+class FastValidator:
+    """ Проверка жителей по схеме без Cerberus: правила схемы один раз 
+    преобразуются в функции, проверка не хранит состояния и может 
+    выполняться из нескольких потоков. Решения совпадают с MyValidator 
+    (с той же схемой и require_all) для документов-словарей
+    """
+    def __init__( self, schema, require_all = False ):
+        self.checks = { field: _compile(rules) for field, rules in schema.items() }
+        self.required = frozenset( schema ) if require_all else frozenset()
+
+    def validate( self, document ):
+        return self.validate_many( (document,) )
+
+    def validate_many( self, documents ):
+        """ True, если все документы documents корректны
+        """
+        today = date.today()
+        checks, required = self.checks, self.required
+
+        for document in documents:
+            if not isinstance( document, dict ) or not required <= document.keys():
+                return False
+
+            for field, value in document.items():
+                check = checks.get( field )
+                if check is None or not check( value, today ):
+                    return False
+        return True
+
+validator_lite = FastValidator(schema)
+validator = FastValidator(schema, require_all=True)
@@ -0,0 +1,90 @@
+""" Пропускная способность записи (POST /imports и PATCH) при работе
+    нескольких рабочих процессов с одной базой данных для профилей:
+    SQLite без настроек, SQLite с SQLITE_PRAGMAS и, если задан адрес, PostgreSQL
+
+    $ python -m benchmarks.db_profiles --workers 4 --requests 200
+    $ python -m benchmarks.db_profiles --postgresql postgresql://localhost/yapi_bench
+"""
+import argparse, json, multiprocessing, os, random, tempfile, time
+from config import TestingConfig
+from app import create_app, db
+from benchmarks.generator import make_import
+from benchmarks.suite import HEADERS, make_config, summarize
+
+def worker( args ):
+    """ Рабочий процесс: каждый десятый запрос - новая выгрузка,
+    остальные - PATCH жителей первой выгрузки
+    """
+    config_name, seed, requests, citizens = args
+    app = create_app( config_name )
+    client = app.test_client( use_cookies = False )
+    rnd = random.Random( seed )
+
+    latencies, errors = [], 0
+    for i in range( requests ):
+        start = time.perf_counter()
+        if i % 10 == 0:
+            data = json.dumps({ 'citizens': make_import( citizens, seed = rnd.random() ) })
+            response = client.post( '/imports', headers = HEADERS, data = data )
+        else:
+            data = json.dumps({ 'name': 'Житель %d' % rnd.randint(0, 10**6) })
+            response = client.patch( '/imports/1/citizens/%d' % rnd.randint(1, citizens),
+                                     headers = HEADERS, data = data )
+        latencies.append( time.perf_counter() - start )
+        errors += response.status_code >= 500
+
+    return latencies, errors
+
+def run_profile( name, uri, pragmas, workers, requests, citizens ):
+    config_name = make_config( uri, pragmas )
+
+    app = create_app( config_name )
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = app.test_client( use_cookies = False )
+        client.post( '/imports', headers = HEADERS, data = json.dumps({ 'citizens': make_import(citizens) }) )
+        db.session.remove()
+        db.get_engine( app ).dispose()
+
+    start = time.perf_counter()
+    with multiprocessing.Pool( workers ) as pool:
+        results = pool.map( worker, [ (config_name, i, requests, citizens) for i in range(workers) ] )
+    elapsed = time.perf_counter() - start
+
+    latencies = [ latency for result, _ in results for latency in result ]
+    return dict( { 'profile': name, 'workers': workers, 'errors': sum( errors for _, errors in results ) },
+                 **summarize( latencies, elapsed ) )
+
+def main():
+    parser = argparse.ArgumentParser( description = 'Database profiles write benchmark' )
+    parser.add_argument( '--workers', type = int, default = 4 )
+    parser.add_argument( '--requests', type = int, default = 200, help = 'requests per worker' )
+    parser.add_argument( '--citizens', type = int, default = 100, help = 'citizens per import' )
+    parser.add_argument( '--postgresql', help = 'PostgreSQL URL, e.g. postgresql://localhost/yapi_bench' )
+    parser.add_argument( '--json', action = 'store_true', help = 'print results as JSON' )
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        profiles = [
+            ( 'sqlite-default', 'sqlite:///' + os.path.join(tmp, 'default.sqlite'), {} ),
+            ( 'sqlite-tuned',   'sqlite:///' + os.path.join(tmp, 'tuned.sqlite'), TestingConfig.SQLITE_PRAGMAS )
+        ]
+        if args.postgresql:
+            profiles.append( ( 'postgresql', args.postgresql, {} ) )
+
+        for name, uri, pragmas in profiles:
+            results.append( run_profile( name, uri, pragmas, args.workers, args.requests, args.citizens ) )
+
+    if args.json:
+        print( json.dumps( results, indent = 2 ) )
+        return
+
+    print( '%-16s %8s %9s %7s %9s %9s %9s %9s' % ('profile', 'workers', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms') )
+    for row in results:
+        print( '%-16s %8d %9d %7d %9.1f %9.2f %9.2f %9.2f' % ( row['profile'], row['workers'], row['requests'],
+               row['errors'], row['rps'], row['p50_ms'], row['p95_ms'], row['p99_ms'] ) )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+""" Синтетические выгрузки для нагрузочного тестирования
+"""
+import random
+
+TOWNS   = [ 'Москва', 'Санкт-Петербург', 'Керчь', 'Тула', 'Новосибирск' ]
+STREETS = [ 'Льва Толстого', 'Ленина', 'Иосифа Бродского', 'Баженова' ]
+NAMES   = [ 'Иванов Иван Иванович', 'Романова Мария Леонидовна', 'Ершов Лука Борисович' ]
+
+def make_citizen( rnd, citizen_id ):
+    return {
+        'citizen_id': citizen_id,
+        'town':       rnd.choice(TOWNS),
+        'street':     rnd.choice(STREETS),
+        'building':   '%dк%dстр%d' % ( rnd.randint(1, 50), rnd.randint(1, 9), rnd.randint(1, 9) ),
+        'apartment':  rnd.randint(1, 500),
+        'name':       rnd.choice(NAMES),
+        'birth_date': '%02d.%02d.%04d' % ( rnd.randint(1, 28), rnd.randint(1, 12), rnd.randint(1940, 2015) ),
+        'gender':     rnd.choice([ 'male', 'female' ]),
+        'relatives':  []
+    }
+
+def make_import( count, relatives = 3, seed = 0 ):
+    """ Корректная выгрузка из count жителей: в среднем relatives
+    родственников на жителя, связи взаимные и без петель
+    """
+    rnd = random.Random( seed )
+    citizens = [ make_citizen( rnd, i ) for i in range(1, count + 1) ]
+
+    edges, target = set(), min( count * relatives // 2, count * (count - 1) // 2 )
+    while len(edges) < target:
+        a, b = rnd.randint(1, count), rnd.randint(1, count)
+        if a != b:
+            edges.add( (min(a, b), max(a, b)) )
+
+    for a, b in sorted(edges):
+        citizens[a - 1]['relatives'].append( b )
+        citizens[b - 1]['relatives'].append( a )
+
+    return citizens
@@ -0,0 +1,66 @@
+""" Сравнение производительности кодировщиков JSON на данных выгрузки
+
+    $ python -m benchmarks.json_backends --citizens 10000 --repeat 5
+"""
+import argparse, json, time
+from app.serializer import BACKENDS
+from benchmarks.generator import make_import
+
+def measure( func, repeat ):
+    """ Лучшее время из repeat запусков
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run( citizens, repeat, sort_keys = True, ensure_ascii = True ):
+    payload = { 'data': citizens }
+    results = []
+
+    for name, cls in BACKENDS.items():
+        try:
+            backend = cls( sort_keys, ensure_ascii )
+        except ImportError:
+            continue
+
+        data = backend.dumps( payload )
+        assert json.loads( data ) == payload
+
+        encode = measure( lambda: backend.dumps( payload ), repeat )
+        decode = measure( lambda: backend.loads( data ), repeat )
+        results.append({
+            'backend':     name,
+            'bytes':       len(data),
+            'encode_ms':   round( encode * 1000, 2 ),
+            'decode_ms':   round( decode * 1000, 2 ),
+            'encode_mb_s': round( len(data) / encode / 2**20, 1 ),
+            'decode_mb_s': round( len(data) / decode / 2**20, 1 )
+        })
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser( description = 'JSON backends benchmark' )
+    parser.add_argument( '--citizens', type = int, default = 10000 )
+    parser.add_argument( '--relatives', type = int, default = 3 )
+    parser.add_argument( '--repeat', type = int, default = 5 )
+    parser.add_argument( '--json', action = 'store_true', help = 'print results as JSON' )
+    args = parser.parse_args()
+
+    results = run( make_import( args.citizens, args.relatives ), args.repeat )
+
+    if args.json:
+        print( json.dumps( results, indent = 2 ) )
+        return
+
+    print( '%-8s %12s %10s %10s %12s %12s' % ('backend', 'bytes', 'encode ms', 'decode ms', 'encode MB/s', 'decode MB/s') )
+    for row in results:
+        print( '%-8s %12d %10.2f %10.2f %12.1f %12.1f' % ( row['backend'], row['bytes'], row['encode_ms'],
+               row['decode_ms'], row['encode_mb_s'], row['decode_mb_s'] ) )
+
+if __name__ == '__main__':
+    main()
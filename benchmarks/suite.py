@@ -0,0 +1,166 @@
+""" Нагрузочное тестирование методов API на синтетической выгрузке.
+    Результаты (пропускная способность, задержки p50/p95/p99) сохраняются
+    в JSON и сравниваются с результатами другого коммита
+
+    $ python manage.py bench --citizens 10000 --output bench.json
+    $ python -m benchmarks.suite --citizens 10000 --compare bench.json
+
+    Проверка загрузки в нескольких процессах (IMPORT_PROCESSES) сравнивается
+    с загрузкой в процессе запроса на той же выгрузке:
+
+    $ python -m benchmarks.suite --citizens 100000 --repeat 5 --output serial.json
+    $ python -m benchmarks.suite --citizens 100000 --repeat 5 --processes 4 --compare serial.json
+"""
+import argparse, json, os, platform, random, subprocess, tempfile, time
+import numpy as np
+from config import config, engine_options, TestingConfig
+from app import create_app, db
+from benchmarks.generator import make_import
+
+HEADERS = { 'Content-Type': 'application/json' }
+
+def make_config( uri, pragmas = TestingConfig.SQLITE_PRAGMAS, **settings ):
+    """ Регистрирует конфигурацию для базы данных uri и возвращает ее имя
+    """
+    name = 'bench-%d' % len(config)
+    config[name] = type( 'BenchConfig', (TestingConfig,), dict({
+        'TESTING': False,
+        'RESPONSE_CACHE': False,
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'SQLALCHEMY_ENGINE_OPTIONS': engine_options( uri ),
+        'SQLITE_PRAGMAS': pragmas
+    }, **settings ))
+    return name
+
+def summarize( latencies, elapsed ):
+    """ Пропускная способность и перцентили задержки (мс)
+    """
+    latencies = np.array( latencies ) * 1000
+    return {
+        'requests': len(latencies),
+        'rps':      round( len(latencies) / elapsed, 1 ),
+        'p50_ms':   round( float(np.percentile(latencies, 50)), 2 ),
+        'p95_ms':   round( float(np.percentile(latencies, 95)), 2 ),
+        'p99_ms':   round( float(np.percentile(latencies, 99)), 2 )
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output( ['git', 'rev-parse', '--short', 'HEAD'],
+                                        stderr = subprocess.DEVNULL ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def endpoints( citizens, import_id, repeat, seed ):
+    """ Запросы к методам API: (имя, количество повторов, функция, 
+    выполняющая запрос клиентом client и возвращающая ответ)
+    """
+    rnd = random.Random( seed )
+    ids = [ citizen['citizen_id'] for citizen in citizens ]
+    body = json.dumps({ 'citizens': citizens })
+
+    def patch_name( client ):
+        return client.patch( '/imports/%d/citizens/%d' % (import_id, rnd.choice(ids)), headers = HEADERS,
+                             data = json.dumps({ 'name': 'Житель %d' % rnd.randint(0, 10**6) }) )
+
+    def patch_relatives( client ):
+        citizen_id = rnd.choice( ids )
+        relatives = [ i for i in rnd.sample( ids, min(3, len(ids)) ) if i != citizen_id ]
+        return client.patch( '/imports/%d/citizens/%d' % (import_id, citizen_id), headers = HEADERS,
+                             data = json.dumps({ 'relatives': relatives }) )
+
+    return [
+        ( 'post_imports',    repeat // 5 + 1, lambda client: client.post( '/imports', headers = HEADERS, data = body ) ),
+        ( 'get_citizens',    repeat, lambda client: client.get( '/imports/%d/citizens' % import_id ) ),
+        ( 'get_birthdays',   repeat, lambda client: client.get( '/imports/%d/citizens/birthdays' % import_id ) ),
+        ( 'get_percentile',  repeat, lambda client: client.get( '/imports/%d/towns/stat/percentile/age' % import_id ) ),
+        ( 'patch_name',      repeat, patch_name ),
+        ( 'patch_relatives', repeat, patch_relatives )
+    ]
+
+def run( citizens = 10000, relatives = 3, repeat = 20, cache = False, seed = 0, processes = 0 ):
+    """ Выполняет каждый запрос repeat раз (загрузку - repeat // 5 + 1 раз)
+    в отдельной базе данных SQLite и возвращает результаты. processes > 0 -
+    проверка загрузок в processes процессах независимо от их размера
+    """
+    data = make_import( citizens, relatives, seed )
+    results = {
+        'commit':    git_commit(),
+        'python':    platform.python_version(),
+        'timestamp': time.strftime( '%Y-%m-%dT%H:%M:%S' ),
+        'params':    { 'citizens': citizens, 'relatives': relatives, 'repeat': repeat, 'cache': cache, 'seed': seed,
+                       'processes': processes, 'cpus': os.cpu_count() },
+        'endpoints': {}
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app( make_config( 'sqlite:///' + os.path.join(tmp, 'bench.sqlite'), RESPONSE_CACHE = cache,
+                                       IMPORT_PROCESSES = processes, IMPORT_PARALLEL_MIN = 1 ) )
+        with app.app_context():
+            db.create_all()
+            client = app.test_client( use_cookies = False )
+
+            response = client.post( '/imports', headers = HEADERS, data = json.dumps({ 'citizens': data }) )
+            import_id = json.loads( response.get_data() )['data']['import_id']
+
+            for name, count, request in endpoints( data, import_id, repeat, seed ):
+                latencies, size = [], 0
+
+                start = time.perf_counter()
+                for _ in range( count ):
+                    begin = time.perf_counter()
+                    response = request( client )
+                    size = len( response.get_data() )
+                    latencies.append( time.perf_counter() - begin )
+                    assert response.status_code in (200, 201), ( name, response.status_code )
+
+                results['endpoints'][name] = dict( summarize( latencies, time.perf_counter() - start ), bytes = size )
+
+            db.session.remove()
+            db.get_engine( app ).dispose()
+
+    return results
+
+def report( results, baseline = None ):
+    """ Таблица результатов; с baseline - отношение p50 к базовому
+    """
+    lines = [ ( '%-16s %9s %10s %10s %10s %10s %12s' % ('endpoint', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+                                                         'p50 change' if baseline else '') ).rstrip() ]
+    for name, row in results['endpoints'].items():
+        change = ''
+        base = baseline and baseline['endpoints'].get( name )
+        if base:
+            change = '%+.1f%%' % ( (row['p50_ms'] / base['p50_ms'] - 1) * 100 )
+        lines.append( ( '%-16s %9d %10.1f %10.2f %10.2f %10.2f %12s' % ( name, row['requests'], row['rps'],
+                        row['p50_ms'], row['p95_ms'], row['p99_ms'], change ) ).rstrip() )
+    return '\n'.join( lines )
+
+def bench( citizens, relatives, repeat, cache = False, output = None, compare = None, processes = 0 ):
+    results = run( citizens, relatives, repeat, cache, processes = processes )
+
+    baseline = None
+    if compare:
+        with open( compare ) as f:
+            baseline = json.load( f )
+
+    print( report( results, baseline ) )
+
+    if output:
+        with open( output, 'w' ) as f:
+            json.dump( results, f, indent = 2 )
+
+def main():
+    parser = argparse.ArgumentParser( description = 'API benchmark suite' )
+    parser.add_argument( '--citizens', type = int, default = 10000 )
+    parser.add_argument( '--relatives', type = int, default = 3, help = 'average relatives per citizen' )
+    parser.add_argument( '--repeat', type = int, default = 20 )
+    parser.add_argument( '--cache', action = 'store_true', help = 'keep the response cache enabled' )
+    parser.add_argument( '--processes', type = int, default = 0, help = 'IMPORT_PROCESSES for POST /imports' )
+    parser.add_argument( '--output', help = 'write results as JSON' )
+    parser.add_argument( '--compare', help = 'results JSON of another commit' )
+    args = parser.parse_args()
+
+    bench( args.citizens, args.relatives, args.repeat, args.cache, args.output, args.compare, args.processes )
+
+if __name__ == '__main__':
+    main()
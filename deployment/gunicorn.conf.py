@@ -0,0 +1,40 @@
+""" Настройки gunicorn: общий для рабочих процессов кэш ответов, 
+    очистка каталога метрик METRICS_DIR и кэша при запуске и перенос 
+    метрик завершившихся рабочих процессов в общий файл
+
+    $ gunicorn -c deployment/gunicorn.conf.py manage:app
+"""
+import os, sys
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) ) )
+
+# Версии выгрузок в кэше в памяти процесса не обновляются при PATCH в
+# других рабочих процессах; задается до чтения настроек из config
+os.environ.setdefault( 'RESPONSE_CACHE_BACKEND', 'sqlite' )
+
+from flask import Config
+from config import config
+from app import metrics
+from app.cache import clear_shared
+
+bind = '0.0.0.0:8080'
+workers = 4
+
+def _settings():
+    settings = Config( os.getcwd() )
+    settings.from_object( config['default'] )
+    return settings
+
+def _directory():
+    settings = _settings()
+    return settings['METRICS_DIR'] if settings['METRICS'] else None
+
+def on_starting( server ):
+    directory = _directory()
+    if directory is not None:
+        metrics.clear( directory )
+    clear_shared( _settings() )
+
+def child_exit( server, worker ):
+    directory = _directory()
+    if directory is not None:
+        metrics.merge( directory, worker.pid )
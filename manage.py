@@ -51,5 +51,18 @@ def test( coverage = False ):
         print('HTML версия: file://%s/index.html' % covdir)
         COV.erase()
 
+@manager.option( '-c', '--citizens', dest = 'citizens', type = int, default = 10000, help = 'Жителей в выгрузке' )
+@manager.option( '-r', '--relatives', dest = 'relatives', type = int, default = 3, help = 'Родственников на жителя' )
+@manager.option( '-n', '--repeat', dest = 'repeat', type = int, default = 20, help = 'Повторов каждого запроса' )
+@manager.option( '--cache', dest = 'cache', action = 'store_true', help = 'Не отключать кэш ответов' )
+@manager.option( '-p', '--processes', dest = 'processes', type = int, default = 0, help = 'IMPORT_PROCESSES для загрузок' )
+@manager.option( '-o', '--output', dest = 'output', help = 'Сохранить результаты в JSON' )
+@manager.option( '--compare', dest = 'compare', help = 'Сравнить с результатами другого коммита' )
+def bench( citizens, relatives, repeat, cache, output, compare, processes ):
+    """ Нагрузочное тестирование методов API на синтетической выгрузке
+    """
+    from benchmarks import suite
+    suite.bench( citizens, relatives, repeat, cache, output, compare, processes )
+
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
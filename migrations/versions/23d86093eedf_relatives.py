@@ -0,0 +1,94 @@
+"""relatives
+
+Revision ID: 23d86093eedf
+Revises: 7045db750be3
+Create Date: 2026-10-18 10:12:41.508233
+
+"""
+import pickle
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '23d86093eedf'
+down_revision = '7045db750be3'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+citizens = sa.table('citizens',
+    sa.column('id', sa.Integer()),
+    sa.column('import_id', sa.Integer()),
+    sa.column('citizen_id', sa.Integer()),
+    sa.column('relatives', sa.PickleType())
+)
+
+relatives = sa.table('relatives',
+    sa.column('id', sa.Integer()),
+    sa.column('import_id', sa.Integer()),
+    sa.column('citizen_id', sa.Integer()),
+    sa.column('relative_id', sa.Integer())
+)
+
+
+def upgrade():
+    op.create_table('relatives',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('import_id', sa.Integer(), nullable=False),
+    sa.Column('citizen_id', sa.Integer(), nullable=False),
+    sa.Column('relative_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['import_id'], ['imports.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_relatives_import_id_citizen_id', 'relatives', ['import_id', 'citizen_id'], unique=False)
+
+    # Перенос родственных связей из сериализованных списков в таблицу relatives.
+    # Значение столбца хранилось как pickle от уже сериализованного списка
+    connection = op.get_bind()
+    query = sa.select([ citizens.c.import_id, citizens.c.citizen_id, citizens.c.relatives ]).\
+               order_by( citizens.c.id )
+
+    rows = []
+    for import_id, citizen_id, data in connection.execute(query):
+        for rel_id in ( pickle.loads(data) if data is not None else [] ):
+            rows.append({ 'import_id': import_id, 'citizen_id': citizen_id, 'relative_id': rel_id })
+
+        if len(rows) >= BATCH_SIZE:
+            op.bulk_insert(relatives, rows)
+            rows = []
+
+    if rows:
+        op.bulk_insert(relatives, rows)
+
+    with op.batch_alter_table('citizens') as batch_op:
+        batch_op.drop_column('relatives')
+
+
+def downgrade():
+    with op.batch_alter_table('citizens') as batch_op:
+        batch_op.add_column(sa.Column('relatives', sa.PickleType(), nullable=True))
+
+    connection = op.get_bind()
+    query = sa.select([ relatives.c.import_id, relatives.c.citizen_id, relatives.c.relative_id ]).\
+               order_by( relatives.c.id )
+
+    data = {}
+    for import_id, citizen_id, rel_id in connection.execute(query):
+        data.setdefault( (import_id, citizen_id), [] ).append( rel_id )
+
+    for ( import_id, citizen_id ), rel_ids in data.items():
+        connection.execute(
+            citizens.update().\
+                     where( sa.and_(citizens.c.import_id == import_id, citizens.c.citizen_id == citizen_id) ).\
+                     values( relatives = pickle.dumps(rel_ids) )
+        )
+
+    # Жители без родственников хранили пустой список
+    connection.execute(
+        citizens.update().where( citizens.c.relatives.is_(None) ).values( relatives = pickle.dumps([]) )
+    )
+
+    op.drop_index('ix_relatives_import_id_citizen_id', table_name='relatives')
+    op.drop_table('relatives')
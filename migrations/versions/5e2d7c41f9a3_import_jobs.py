@@ -0,0 +1,34 @@
+"""import jobs
+
+Revision ID: 5e2d7c41f9a3
+Revises: b3c9e1d27a40
+Create Date: 2026-10-18 15:10:42.096117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2d7c41f9a3'
+down_revision = 'b3c9e1d27a40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('citizens', sa.Integer(), nullable=False),
+    sa.Column('import_id', sa.Integer(), nullable=True),
+    sa.Column('error', sa.String(length=256), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.Column('finished', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['import_id'], ['imports.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('import_jobs')
@@ -0,0 +1,92 @@
+"""birth_date
+
+Revision ID: 70510eb40b06
+Revises: 23d86093eedf
+Create Date: 2026-10-18 11:02:17.164820
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '70510eb40b06'
+down_revision = '23d86093eedf'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def _convert(source, target, convert):
+    """ Построчное преобразование столбца source в target пакетами UPDATE-запросов
+    """
+    citizens = sa.table('citizens',
+        sa.column('id', sa.Integer()),
+        source,
+        *target
+    )
+    update = citizens.update().\
+                      where( citizens.c.id == sa.bindparam('_id') ).\
+                      values({ column.name: sa.bindparam(column.name) for column in target })
+
+    connection = op.get_bind()
+    rows = []
+    for citizen_id, value in connection.execute( sa.select([ citizens.c.id, source ]) ).fetchall():
+        rows.append( dict( convert(value), _id = citizen_id ) )
+
+        if len(rows) >= BATCH_SIZE:
+            connection.execute( update, rows )
+            rows = []
+
+    if rows:
+        connection.execute( update, rows )
+
+
+def _from_string(value):
+    born = datetime.strptime(value, '%d.%m.%Y').date()
+    return { 'birth_date_new': born, 'birth_month': born.month, 'birth_day': born.day }
+
+
+def _to_string(value):
+    return { 'birth_date_old': '%02d.%02d.%04d' % (value.day, value.month, value.year) }
+
+
+def upgrade():
+    with op.batch_alter_table('citizens') as batch_op:
+        batch_op.add_column(sa.Column('birth_date_new', sa.Date(), nullable=True))
+        batch_op.add_column(sa.Column('birth_month', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('birth_day', sa.SmallInteger(), nullable=True))
+
+    _convert(
+        sa.column('birth_date', sa.String()),
+        [ sa.column('birth_date_new', sa.Date()), sa.column('birth_month', sa.SmallInteger()),
+          sa.column('birth_day', sa.SmallInteger()) ],
+        _from_string
+    )
+
+    with op.batch_alter_table('citizens') as batch_op:
+        batch_op.drop_column('birth_date')
+        batch_op.alter_column('birth_date_new', new_column_name='birth_date', existing_type=sa.Date(), nullable=False)
+        batch_op.alter_column('birth_month', existing_type=sa.SmallInteger(), nullable=False)
+        batch_op.alter_column('birth_day', existing_type=sa.SmallInteger(), nullable=False)
+        batch_op.create_index('ix_citizens_import_id_birth_month_birth_day', ['import_id', 'birth_month', 'birth_day'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('citizens') as batch_op:
+        batch_op.drop_index('ix_citizens_import_id_birth_month_birth_day')
+        batch_op.add_column(sa.Column('birth_date_old', sa.String(length=10), nullable=True))
+
+    _convert(
+        sa.column('birth_date', sa.Date()),
+        [ sa.column('birth_date_old', sa.String(length=10)) ],
+        _to_string
+    )
+
+    with op.batch_alter_table('citizens') as batch_op:
+        batch_op.drop_column('birth_month')
+        batch_op.drop_column('birth_day')
+        batch_op.drop_column('birth_date')
+        batch_op.alter_column('birth_date_old', new_column_name='birth_date', existing_type=sa.String(length=10), nullable=False)
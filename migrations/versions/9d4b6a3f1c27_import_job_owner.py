@@ -0,0 +1,26 @@
+"""import job owner
+
+Revision ID: 9d4b6a3f1c27
+Revises: c81f4a06d5b2
+Create Date: 2026-10-18 18:02:13.514270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b6a3f1c27'
+down_revision = 'c81f4a06d5b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('import_jobs') as batch_op:
+        batch_op.add_column(sa.Column('owner', sa.String(length=128), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('import_jobs') as batch_op:
+        batch_op.drop_column('owner')
@@ -0,0 +1,67 @@
+"""presents
+
+Revision ID: b3c9e1d27a40
+Revises: f78f6e57e5aa
+Create Date: 2026-10-18 14:02:11.418203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3c9e1d27a40'
+down_revision = 'f78f6e57e5aa'
+branch_labels = None
+depends_on = None
+
+
+def _fill(connection, presents):
+    """ Заполняет таблицу подарков по существующим жителям и связям
+    """
+    query = sa.text('SELECT c.import_id, c.birth_month, r.relative_id, c.id, r.id '
+                    'FROM citizens c JOIN relatives r '
+                    'ON r.import_id = c.import_id AND r.citizen_id = c.citizen_id')
+
+    items = {}
+    for import_id, month, citizen_id, first_citizen, first_relative in connection.execute(query):
+        first = (first_citizen, first_relative)
+        item = items.get((import_id, month, citizen_id))
+        if item is None:
+            items[(import_id, month, citizen_id)] = [1, first]
+        else:
+            item[0] += 1
+            item[1] = min(item[1], first)
+
+    rows = [{'import_id': import_id, 'month': month, 'citizen_id': citizen_id, 'presents': count,
+             'first_citizen': first[0], 'first_relative': first[1]}
+            for (import_id, month, citizen_id), (count, first) in items.items()]
+
+    for i in range(0, len(rows), 5000):
+        connection.execute(presents.insert(), rows[i:i + 5000])
+
+
+def upgrade():
+    presents = op.create_table('presents',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('import_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.SmallInteger(), nullable=False),
+    sa.Column('citizen_id', sa.Integer(), nullable=False),
+    sa.Column('presents', sa.Integer(), nullable=False),
+    sa.Column('first_citizen', sa.Integer(), nullable=False),
+    sa.Column('first_relative', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['import_id'], ['imports.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_presents_import_id_month', 'presents', ['import_id', 'month', 'first_citizen', 'first_relative'], unique=False)
+    op.create_index('ix_presents_import_id_citizen_id', 'presents', ['import_id', 'citizen_id'], unique=False)
+    op.create_index('ix_relatives_import_id_relative_id', 'relatives', ['import_id', 'relative_id'], unique=False)
+
+    _fill(op.get_bind(), presents)
+
+
+def downgrade():
+    op.drop_index('ix_relatives_import_id_relative_id', table_name='relatives')
+    op.drop_index('ix_presents_import_id_citizen_id', table_name='presents')
+    op.drop_index('ix_presents_import_id_month', table_name='presents')
+    op.drop_table('presents')
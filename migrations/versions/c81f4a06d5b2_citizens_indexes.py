@@ -0,0 +1,46 @@
+"""citizens indexes
+
+Revision ID: c81f4a06d5b2
+Revises: 5e2d7c41f9a3
+Create Date: 2026-10-18 16:24:57.311084
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f4a06d5b2'
+down_revision = '5e2d7c41f9a3'
+branch_labels = None
+depends_on = None
+
+
+def _check_duplicates(connection):
+    """ Уникальный индекс (import_id, citizen_id) не создается, если в
+    базе есть повторяющиеся жители одной выгрузки (выгрузки, записанные
+    одновременно до выделения import_id по вставленной строке imports).
+    Миграция прерывается до изменения схемы: какие строки оставить,
+    решается вручную
+    """
+    query = sa.text('SELECT import_id, citizen_id, COUNT(*) FROM citizens '
+                    'GROUP BY import_id, citizen_id HAVING COUNT(*) > 1 '
+                    'ORDER BY import_id, citizen_id LIMIT 20')
+    duplicates = connection.execute(query).fetchall()
+    if duplicates:
+        raise RuntimeError('Duplicate (import_id, citizen_id) in citizens, remove them before upgrade: ' +
+                           ', '.join('(%d, %d) x%d' % tuple(row) for row in duplicates) +
+                           (' ...' if len(duplicates) == 20 else ''))
+
+
+def upgrade():
+    _check_duplicates(op.get_bind())
+    op.create_index('ix_citizens_import_id_citizen_id', 'citizens', ['import_id', 'citizen_id'], unique=True)
+    op.create_index('ix_citizens_import_id_town', 'citizens', ['import_id', 'town', 'birth_date'], unique=False)
+    op.drop_index('ix_citizens_citizen_id', table_name='citizens')
+
+
+def downgrade():
+    op.create_index('ix_citizens_citizen_id', 'citizens', ['citizen_id'], unique=False)
+    op.drop_index('ix_citizens_import_id_town', table_name='citizens')
+    op.drop_index('ix_citizens_import_id_citizen_id', table_name='citizens')
@@ -0,0 +1,26 @@
+"""import version
+
+Revision ID: f78f6e57e5aa
+Revises: 70510eb40b06
+Create Date: 2026-10-18 12:20:05.731942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f78f6e57e5aa'
+down_revision = '70510eb40b06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('imports') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('imports') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,67 @@
+import unittest, json
+from datetime import datetime
+from app import create_app, db
+
+def make_citizen( citizen_id, **fields ):
+    """ Корректный житель citizen_id без родственников; fields заменяют
+    значения полей по умолчанию
+    """
+    citizen = {
+        "citizen_id": citizen_id, "town": "Москва", "street": "Льва Толстого",
+        "building": "16к7стр5", "apartment": 7, "name": "Иванов Иван Иванович",
+        "birth_date": "26.12.1986", "gender": "male", "relatives": []
+    }
+    citizen.update( fields )
+    return citizen
+
+class ApiTestCase( unittest.TestCase ):
+    """ Приложение с тестовой базой данных и клиент API. Настройки 
+    приложения изменяются в configure() до создания таблиц
+    """
+    def setUp( self ):
+        self.app = create_app('testing')
+        self.configure()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client( use_cookies = False )
+
+    def tearDown( self ):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def configure( self ):
+        pass
+
+    def get_api_headers( self ):
+        return {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'Date': datetime.today().strftime('%a, %d %b %Y %H:%M:%S GMT')
+        }
+
+    def post_import( self, citizens ):
+        """ Загружает выгрузку и возвращает ее import_id
+        """
+        response = self.client.post( '/imports', headers = self.get_api_headers(), data = json.dumps({ "citizens": citizens }) )
+        self.assertEqual( response.status_code, 201 )
+        return json.loads( response.get_data( as_text = True ) )['data']['import_id']
+
+def random_date( rnd ):
+    return '%02d.%02d.%04d' % ( rnd.randint(1, 28), rnd.randint(1, 12), rnd.randint(1950, 2010) )
+
+def random_relatives( rnd, citizen_id, count ):
+    return rnd.sample( [ i for i in range(1, count + 1) if i != citizen_id ], rnd.randint(0, 4) )
+
+def random_import( rnd, count ):
+    """ Выгрузка из count жителей со случайными датами рождения и 
+    взаимными родственными связями (генератор случайных чисел rnd)
+    """
+    citizens = [ make_citizen( i, apartment = i, birth_date = random_date( rnd ) ) for i in range(1, count + 1) ]
+    for citizen in citizens:
+        for rel_id in random_relatives( rnd, citizen['citizen_id'], count ):
+            if rel_id not in citizen['relatives']:
+                citizen['relatives'].append( rel_id )
+                citizens[rel_id - 1]['relatives'].append( citizen['citizen_id'] )
+    return citizens
@@ -1,9 +1,17 @@
-import unittest, json, pickle, numpy as np
-from datetime import datetime
+import unittest, json, threading, numpy as np
+from datetime import datetime, date
+from unittest import mock
 from app import create_app, db
-from app.models import Import, Citizen
+from app.models import Import, Citizen, Relative
 from app.validation import _unique
 
+class FrozenDate( date ):
+    """ Фиксированная текущая дата для проверки расчета возраста
+    """
+    @classmethod
+    def today( cls ):
+        return cls( 2019, 8, 25 )
+
 class APITestCase( unittest.TestCase ):
     def setUp( self ):
         """ Инициализация экземпляра приложения
@@ -51,7 +59,7 @@ class APITestCase( unittest.TestCase ):
         ]
 
         # Запрос на создание выгрузки
-        import_id = Import.get_index()
+        import_id = 1 # первая выгрузка в пустой базе данных
         response = self.client.post(
             '/imports',
             headers = self.get_api_headers(),
@@ -68,9 +76,9 @@ class APITestCase( unittest.TestCase ):
         result = True
         import_citizens = Citizen.query.filter_by( import_id = import_id ).all()
         for citizen in import_citizens:
-            for rel_id in pickle.loads(citizen.relatives):
+            for rel_id in Relative.get_list( import_id, citizen.citizen_id ):
                 relative = Citizen.query.filter_by( citizen_id = rel_id, import_id = import_id ).first()
-                relatives = pickle.loads(relative.relatives)
+                relatives = Relative.get_list( import_id, relative.citizen_id )
                 if not citizen.citizen_id in relatives:
                     result = False
         self.assertTrue( result )
@@ -151,6 +159,60 @@ class APITestCase( unittest.TestCase ):
         json_response = json.loads( response.get_data( as_text = True ) )
         self.assertEqual( json_response['Error 400'], 'Bad Request' )
 
+    def test_post_400_nothing_saved( self ):
+        """ Некорректный житель в конце выгрузки: в базу данных 
+        не должно попасть ни одной записи
+        """
+        citizen = [
+            {
+                "citizen_id": 1, "town": "Москва", "street": "Льва Толстого",
+                "building": "16к7стр5", "apartment": 7, "name": "Иванов Иван Иванович",
+                "birth_date": "26.12.1986", "gender": "male", "relatives": []
+            },
+            {
+                "citizen_id": 2, "town": "Москва", "street": "Льва Толстого",
+                "building": "16к7стр5", "apartment": 7, "name": "Иванов Сергей Иванович",
+                "birth_date": "31.02.1997", "gender": "male", "relatives": []
+            }
+        ]
+
+        response = self.client.post(
+            '/imports',
+            headers = self.get_api_headers(),
+            data = json.dumps({ "citizens" : citizen })
+        )
+
+        self.assertEqual( response.status_code, 400 )
+        self.assertEqual( Citizen.query.count(), 0 )
+        self.assertEqual( Import.query.count(), 0 )
+
+    def test_post_400_relatives( self ):
+        """ Родственная связь ссылается на жителя, отсутствующего в выгрузке
+        """
+        citizen = [
+            {
+                "citizen_id": 1, "town": "Москва", "street": "Льва Толстого",
+                "building": "16к7стр5", "apartment": 7, "name": "Иванов Иван Иванович",
+                "birth_date": "26.12.1986", "gender": "male", "relatives": [2, 5]
+            },
+            {
+                "citizen_id": 2, "town": "Москва", "street": "Льва Толстого",
+                "building": "16к7стр5", "apartment": 7, "name": "Иванов Сергей Иванович",
+                "birth_date": "01.04.1997", "gender": "male", "relatives": [1]
+            }
+        ]
+
+        response = self.client.post(
+            '/imports',
+            headers = self.get_api_headers(),
+            data = json.dumps({ "citizens" : citizen })
+        )
+
+        self.assertEqual( response.status_code, 400 )
+        json_response = json.loads( response.get_data( as_text = True ) )
+        self.assertEqual( json_response['Error 400'], 'Bad Request' )
+        self.assertEqual( Citizen.query.count(), 0 )
+
     def test_post_unique( self ):
         """ Проверка на уникальность идентификаторов горожан
         """
@@ -174,7 +236,7 @@ class APITestCase( unittest.TestCase ):
         ]
 
         # Запрос на создание выгрузки
-        import_id = Import.get_index()
+        import_id = 1 # первая выгрузка в пустой базе данных
         response =self.client.post(
             '/imports',
             headers = self.get_api_headers(),
@@ -190,6 +252,48 @@ class APITestCase( unittest.TestCase ):
         citizens_id = [ citizen.id for citizen in citizens ]
         self.assertTrue( len(citizens_id) == np.unique(citizens_id).size )
 
+    def test_post_concurrent( self ):
+        """ Параллельные POST-запросы должны получать разные import_id 
+        и не смешивать жителей разных выгрузок
+        """
+        towns = [ 'Город %d' % i for i in range(8) ]
+        results = {}
+
+        def post( town ):
+            citizen = [
+                {
+                    "citizen_id": i, "town": town, "street": "Льва Толстого",
+                    "building": "16к7стр5", "apartment": 7, "name": "Иванов Иван Иванович",
+                    "birth_date": "26.12.1986", "gender": "male", "relatives": []
+                } for i in range(1, 51)
+            ]
+            response = self.app.test_client( use_cookies = False ).post(
+                '/imports',
+                headers = self.get_api_headers(),
+                data = json.dumps({ "citizens" : citizen })
+            )
+            results[town] = response
+
+        threads = [ threading.Thread( target = post, args = (town,) ) for town in towns ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual( len(results), len(towns) )
+        for response in results.values():
+            self.assertEqual( response.status_code, 201 )
+
+        import_ids = { town: json.loads( response.get_data( as_text = True ) )['data']['import_id']
+                       for town, response in results.items() }
+        self.assertEqual( len(set(import_ids.values())), len(towns) )
+
+        # Каждая выгрузка содержит только своих жителей
+        for town, import_id in import_ids.items():
+            citizens = Citizen.query.filter_by( import_id = import_id ).all()
+            self.assertEqual( len(citizens), 50 )
+            self.assertEqual( { citizen.town for citizen in citizens }, { town } )
+
     def test_patch_404( self ):
         """ Изменение данных несуществующего горожанина
         """
@@ -227,7 +331,7 @@ class APITestCase( unittest.TestCase ):
         old_relatives = citizen[2]['relatives'] #  для проверки родственных связей
 
         # Запрос на создание выгрузки
-        import_id = Import.get_index()
+        import_id = 1 # первая выгрузка в пустой базе данных
         self.client.post(
             '/imports',
             headers = self.get_api_headers(),
@@ -253,18 +357,56 @@ class APITestCase( unittest.TestCase ):
         result = True
         for rel_id in old_relatives:
             relative = Citizen.query.filter_by( import_id = import_id, citizen_id = rel_id ).first()
-            relatives = pickle.loads(relative.relatives)
+            relatives = Relative.get_list( import_id, relative.citizen_id )
             if 3 in relatives:
                 result = False
 
         for rel_id in new_relatives:
             relative = Citizen.query.filter_by( import_id = import_id, citizen_id = rel_id ).first()
-            relatives = pickle.loads(relative.relatives)
+            relatives = Relative.get_list( import_id, relative.citizen_id )
             if not 3 in relatives:
                 result = False
 
         self.assertTrue( result )
 
+    def test_patch_birth_date( self ):
+        """ Изменение даты рождения: формат ответа и месяц в '.../birthdays'
+        """
+        self.client.post(
+            '/imports',
+            headers = self.get_api_headers(),
+            data = json.dumps({ "citizens" : [
+                {
+                    "citizen_id": 1, "town": "Москва", "street": "Льва Толстого",
+                    "building": "16к7стр5", "apartment": 7, "name": "Иванов Иван Иванович",
+                    "birth_date": "26.12.1986", "gender": "male", "relatives": [2]
+                },
+                {
+                    "citizen_id": 2, "town": "Москва", "street": "Льва Толстого",
+                    "building": "16к7стр5", "apartment": 7, "name": "Иванов Сергей Иванович",
+                    "birth_date": "01.04.1997", "gender": "male", "relatives": [1]
+                }
+            ]})
+        )
+
+        response = self.client.patch(
+            '/imports/1/citizens/1',
+            headers = self.get_api_headers(),
+            data = json.dumps({ "birth_date": "05.03.1986" })
+        )
+
+        self.assertEqual( response.status_code, 200 )
+        json_response = json.loads( response.get_data( as_text = True ) )
+        self.assertEqual( json_response['data']['birth_date'], '05.03.1986' )
+
+        response = self.client.get(
+            '/imports/1/citizens/birthdays',
+            headers = self.get_api_headers(),
+        )
+        json_response = json.loads( response.get_data( as_text = True ) )
+        self.assertEqual( json_response['data']['12'], [] )
+        self.assertEqual( json_response['data']['3'], [{ 'citizen_id': 2, 'present': 1 }] )
+
     def test_patch_400( self ):
         """ Некорректное изменение данных горожанина
         """
@@ -291,6 +433,7 @@ class APITestCase( unittest.TestCase ):
         self.assertEqual( response.status_code, 400 )
         json_response = json.loads( response.get_data( as_text = True ) )
         self.assertEqual( json_response['Error 400'], 'Bad Request' )
+        self.assertEqual( Relative.get_list( 1, 1 ), [] )
 
         # Некорректный запрос: Изменение уникального идентификатора
         response = self.client.patch(
@@ -399,6 +542,39 @@ class APITestCase( unittest.TestCase ):
         json_response = json.loads( response.get_data( as_text = True ) )
         self.assertEqual( json_response['data'], citizen )
 
+    def test_get_200_stream( self ):
+        """ Потоковая выгрузка данных, состоящая из нескольких частей
+        """
+        self.app.config['CITIZENS_STREAM_CHUNK'] = 3
+
+        citizen = [
+            {
+                "citizen_id": i, "town": "Москва", "street": "Льва Толстого",
+                "building": "16к7стр5", "apartment": i, "name": "Иванов Иван Иванович",
+                "birth_date": "26.12.1986", "gender": "male",
+                "relatives": [ j for j in (i - 1, i + 1) if 1 <= j <= 10 ]
+            } for i in range(1, 11)
+        ]
+        citizen[4]['relatives'] = []
+        citizen[3]['relatives'] = [3]
+        citizen[5]['relatives'] = [7]
+
+        self.client.post(
+            '/imports',
+            headers = self.get_api_headers(),
+            data = json.dumps({ "citizens" : citizen })
+        )
+
+        response = self.client.get(
+            '/imports/1/citizens',
+            headers = self.get_api_headers()
+        )
+
+        self.assertEqual( response.status_code, 200 )
+        self.assertTrue( response.is_streamed )
+        json_response = json.loads( response.get_data( as_text = True ) )
+        self.assertEqual( json_response['data'], citizen )
+
     def test_get_birthdays_404( self ):
         """ Тестирование GET-запроса '.../birthdays' для несуществующих данных
         """
@@ -549,11 +725,13 @@ class APITestCase( unittest.TestCase ):
             data = json.dumps({ "citizens" : citizen })
         )
 
-        # Запрос статистики определенной выгрузки
-        response = self.client.get(
-            '/imports/1/towns/stat/percentile/age',
-            headers = self.get_api_headers(),
-        )
+        # Запрос статистики определенной выгрузки на дату, 
+        # для которой рассчитаны ожидаемые значения
+        with mock.patch( 'app.main.views.date', FrozenDate ):
+            response = self.client.get(
+                '/imports/1/towns/stat/percentile/age',
+                headers = self.get_api_headers(),
+            )
 
         self.assertEqual( response.status_code, 200 )
         json_response = json.loads( response.get_data( as_text = True ) )
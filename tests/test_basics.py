@@ -18,4 +18,25 @@ class BasicsTestCase( unittest.TestCase ):
         self.assertFalse( current_app is None )
     
     def test_app_is_testing( self ):
-        self.assertTrue( current_app.config['TESTING'] )
\ No newline at end of file
+        self.assertTrue( current_app.config['TESTING'] )
+
+    def test_sqlite_pragmas( self ):
+        """ PRAGMA из SQLITE_PRAGMAS выполняются при соединении
+        """
+        journal_mode, = db.session.execute( 'PRAGMA journal_mode' ).fetchone()
+        busy_timeout, = db.session.execute( 'PRAGMA busy_timeout' ).fetchone()
+        synchronous,  = db.session.execute( 'PRAGMA synchronous' ).fetchone()
+
+        self.assertEqual( journal_mode, 'wal' )
+        self.assertEqual( busy_timeout, current_app.config['SQLITE_PRAGMAS']['busy_timeout'] )
+        self.assertEqual( synchronous, 1 ) # NORMAL
+
+    def test_engine_options( self ):
+        """ Параметры пула соединений задаются только для PostgreSQL
+        """
+        from config import engine_options
+        self.assertEqual( engine_options('sqlite:///data.sqlite'), {} )
+
+        options = engine_options('postgresql://localhost/yapi')
+        self.assertEqual( options['pool_size'], 5 )
+        self.assertEqual( options['max_overflow'], 10 )
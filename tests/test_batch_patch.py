@@ -0,0 +1,76 @@
+import json, random
+from app.models import Import
+from .base import ApiTestCase, random_date, random_relatives, random_import
+
+class BatchPatchTestCase( ApiTestCase ):
+    def setUp( self ):
+        super().setUp()
+        self.random = random.Random( 7 )
+
+    def random_update( self, count ):
+        citizen_id = self.random.randint(1, count)
+        update = { 'citizen_id': citizen_id }
+        for field in self.random.sample( [ 'name', 'birth_date', 'relatives', 'town' ], self.random.randint(1, 3) ):
+            if field == 'name':
+                update['name'] = 'Житель %d' % self.random.randint(0, 1000)
+            elif field == 'town':
+                update['town'] = self.random.choice([ 'Керчь', 'Тула' ])
+            elif field == 'birth_date':
+                update['birth_date'] = random_date( self.random )
+            else:
+                update['relatives'] = random_relatives( self.random, citizen_id, count )
+        return update
+
+    def patch( self, import_id, updates ):
+        return self.client.patch( '/imports/%d/citizens' % import_id, headers = self.get_api_headers(),
+                                  data = json.dumps({ "citizens": updates }) )
+
+    def state( self, import_id ):
+        return [ json.loads( self.client.get( url % import_id, headers = self.get_api_headers() ).get_data( as_text = True ) )
+                 for url in ( '/imports/%d/citizens', '/imports/%d/citizens/birthdays' ) ]
+
+    def test_sequential( self ):
+        """ Пакетное изменение дает тот же результат (жители, порядок связей,
+        подарки), что и последовательные PATCH отдельных жителей
+        """
+        citizens = random_import( self.random, 20 )
+        first, second = self.post_import( citizens ), self.post_import( citizens )
+
+        for _ in range(5):
+            updates = [ self.random_update( 20 ) for _ in range( self.random.randint(1, 15) ) ]
+
+            expected = {}
+            for update in updates:
+                body = { k: v for k, v in update.items() if k != 'citizen_id' }
+                response = self.client.patch( '/imports/%d/citizens/%d' % (first, update['citizen_id']),
+                                              headers = self.get_api_headers(), data = json.dumps( body ) )
+                self.assertEqual( response.status_code, 200 )
+                expected[update['citizen_id']] = json.loads( response.get_data( as_text = True ) )['data']
+
+            response = self.patch( second, updates )
+            self.assertEqual( response.status_code, 200 )
+            data = json.loads( response.get_data( as_text = True ) )['data']
+            self.assertEqual( data, [ self.state( first )[0]['data'][citizen_id - 1] for citizen_id in expected ] )
+            self.assertEqual( self.state( first ), self.state( second ) )
+
+        self.assertEqual( Import.get_version( second ), 6 )
+
+    def test_errors( self ):
+        """ При ошибке в любом изменении выгрузка не меняется
+        """
+        import_id = self.post_import( random_import( self.random, 5 ) )
+        before = self.state( import_id )
+
+        ok = { 'citizen_id': 1, 'name': 'Житель', 'relatives': [2, 3] }
+        for updates, status in ( ( [ ok, { 'citizen_id': 6, 'name': 'Житель' } ], 404 ),
+                                 ( [ ok, { 'citizen_id': 2, 'relatives': [7] } ], 400 ),
+                                 ( [ ok, { 'citizen_id': 2, 'relatives': [2] } ], 400 ),
+                                 ( [ ok, { 'citizen_id': 2 } ], 400 ),
+                                 ( [ ok, { 'name': 'Житель' } ], 400 ),
+                                 ( [ ok, { 'citizen_id': 2, 'birth_date': '31.02.2000' } ], 400 ),
+                                 ( [], 400 ) ):
+            self.assertEqual( self.patch( import_id, updates ).status_code, status )
+            self.assertEqual( self.state( import_id ), before )
+
+        self.assertEqual( self.patch( 2, [ ok ] ).status_code, 404 )
+        self.assertEqual( Import.get_version( import_id ), 1 )
@@ -0,0 +1,358 @@
+import unittest, json, os, tempfile
+from unittest import mock
+from sqlalchemy import event
+from app import db
+from app.models import Import, Citizen
+from app.cache import LRUCache, SQLiteCache, cache, clear_shared
+from .base import ApiTestCase, make_citizen
+
+class LRUCacheTestCase( unittest.TestCase ):
+    def test_eviction( self ):
+        """ Вытеснение давно не использованных записей по размеру
+        """
+        lru = LRUCache( max_size = 10, max_item = 8 )
+        lru.set( 'a', b'1234' )
+        lru.set( 'b', b'1234' )
+        lru.get( 'a' )
+        lru.set( 'c', b'1234' )
+
+        self.assertEqual( lru.get('a'), b'1234' )
+        self.assertIsNone( lru.get('b') )
+        self.assertEqual( lru.get('c'), b'1234' )
+        self.assertEqual( lru.size, 8 )
+
+        # Слишком большие значения не сохраняются
+        lru.set( 'd', b'123456789' )
+        self.assertIsNone( lru.get('d') )
+
+    def test_ttl( self ):
+        """ Записи с истекшим временем жизни не возвращаются
+        """
+        lru = LRUCache( max_size = 10, max_item = 8 )
+        lru.set( 'a', b'1', ttl = -1 )
+        lru.set( 'b', b'2', ttl = 60 )
+
+        self.assertIsNone( lru.get('a') )
+        self.assertEqual( lru.get('b'), b'2' )
+        self.assertEqual( lru.size, 1 )
+
+    def test_set_max( self ):
+        """ Значение set_max только увеличивается, пока не истекло время жизни
+        """
+        lru = LRUCache( max_size = 100, max_item = 50 )
+        lru.set_max( 'version', 3, ttl = 60 )
+        lru.set_max( 'version', 2, ttl = 60 )
+        self.assertEqual( int( lru.get('version') ), 3 )
+        lru.set_max( 'version', 10, ttl = 60 )
+        self.assertEqual( int( lru.get('version') ), 10 )
+
+        lru.set_max( 'version', 12, ttl = -1 )
+        lru.set_max( 'version', 4, ttl = 60 )
+        self.assertEqual( int( lru.get('version') ), 4 )
+
+        lru.delete( 'version' )
+        self.assertIsNone( lru.get('version') )
+        self.assertEqual( lru.size, 0 )
+
+class SQLiteCacheTestCase( unittest.TestCase ):
+    def setUp( self ):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join( self.dir.name, 'cache.sqlite' )
+
+    def tearDown( self ):
+        self.dir.cleanup()
+
+    def test_shared( self ):
+        """ Записи одного экземпляра видны другому (другому процессу)
+        """
+        first = SQLiteCache( self.path, max_size = 100, max_item = 50 )
+        second = SQLiteCache( self.path, max_size = 100, max_item = 50 )
+
+        first.set( ('key', 1), b'value' )
+        self.assertEqual( second.get( ('key', 1) ), b'value' )
+        self.assertIsNone( second.get( ('key', 2) ) )
+
+        second.set( ('key', 1), b'other', ttl = -1 )
+        self.assertIsNone( first.get( ('key', 1) ) )
+
+    def test_eviction( self ):
+        """ Вытеснение записей с самым давним обращением по размеру
+        """
+        sqlite = SQLiteCache( self.path, max_size = 10, max_item = 8 )
+        sqlite.set( 'a', b'1234' )
+        sqlite.set( 'b', b'1234' )
+
+        # Время обращения обновляется не чаще раза в секунду
+        sqlite.connection.execute( 'UPDATE cache SET accessed = accessed - 10' )
+        sqlite.get( 'a' )
+        sqlite.set( 'c', b'1234' )
+
+        self.assertEqual( sqlite.get('a'), b'1234' )
+        self.assertIsNone( sqlite.get('b') )
+        self.assertEqual( sqlite.get('c'), b'1234' )
+
+        sqlite.set( 'd', b'123456789' )
+        self.assertIsNone( sqlite.get('d') )
+
+    def test_set_max( self ):
+        """ Значение set_max только увеличивается, пока не истекло время жизни
+        """
+        first = SQLiteCache( self.path, max_size = 100, max_item = 50 )
+        second = SQLiteCache( self.path, max_size = 100, max_item = 50 )
+
+        first.set_max( 'version', 3, ttl = 60 )
+        second.set_max( 'version', 2, ttl = 60 )
+        self.assertEqual( first.get('version'), 3 )
+        second.set_max( 'version', 10, ttl = 60 )
+        self.assertEqual( first.get('version'), 10 )
+
+        # Запись с истекшим временем жизни заменяется любым значением
+        first.set_max( 'version', 12, ttl = -1 )
+        second.set_max( 'version', 4, ttl = 60 )
+        self.assertEqual( first.get('version'), 4 )
+
+    def test_size( self ):
+        """ Суммарный размер записей в cache_size совпадает с размером 
+        записей после вставки, замены, удаления и очистки, в том числе
+        для файла кэша без таблицы cache_size
+        """
+        sqlite = SQLiteCache( self.path, max_size = 100, max_item = 50 )
+        def sizes():
+            connection = sqlite.connection
+            return ( connection.execute( 'SELECT size FROM cache_size' ).fetchone()[0],
+                     connection.execute( 'SELECT COALESCE(SUM(size), 0) FROM cache' ).fetchone()[0] )
+
+        sqlite.set( 'a', b'1234' )
+        sqlite.set( 'b', b'12' )
+        sqlite.set( 'a', b'123456' )
+        sqlite.set_max( 'version', 3 )
+        sqlite.set_max( 'version', 4 )
+        self.assertEqual( sizes(), (16, 16) )
+
+        sqlite.delete( 'b' )
+        self.assertEqual( sizes(), (14, 14) )
+
+        sqlite.connection.executescript( 'DROP TABLE cache_size; DROP TRIGGER cache_insert; '
+                                         'DROP TRIGGER cache_update; DROP TRIGGER cache_delete' )
+        sqlite = SQLiteCache( self.path, max_size = 100, max_item = 50 )
+        self.assertEqual( sizes(), (14, 14) )
+
+        sqlite.clear()
+        self.assertEqual( sizes(), (0, 0) )
+
+    def test_namespace( self ):
+        """ Экземпляры с разными пространствами имен (базами данных) 
+        не видят записи друг друга
+        """
+        first = SQLiteCache( self.path, max_size = 100, max_item = 50, namespace = 'sqlite:///a' )
+        second = SQLiteCache( self.path, max_size = 100, max_item = 50, namespace = 'sqlite:///b' )
+
+        first.set( 'key', b'a' )
+        self.assertIsNone( second.get('key') )
+        second.set( 'key', b'b' )
+        self.assertEqual( first.get('key'), b'a' )
+
+class ResponseCacheTestCase( ApiTestCase ):
+    def setUp( self ):
+        super().setUp()
+        self.post_import([ make_citizen( 1, relatives = [2] ),
+                           make_citizen( 2, town = "Керчь", name = "Иванов Сергей Иванович",
+                                         birth_date = "01.04.1997", relatives = [1] ) ])
+
+    def rename_in_db( self, name ):
+        """ Изменение данных в обход API (без изменения версии выгрузки)
+        """
+        Citizen.query.filter_by( import_id = 1, citizen_id = 1 ).update({ 'name': name })
+        db.session.commit()
+
+    def get_name( self, response ):
+        return json.loads( response.get_data( as_text = True ) )['data'][0]['name']
+
+    def test_cached( self ):
+        """ Повторный запрос возвращается из кэша
+        """
+        for url in ( '/imports/1/citizens', '/imports/1/citizens/birthdays',
+                     '/imports/1/towns/stat/percentile/age' ):
+            first = self.client.get( url, headers = self.get_api_headers() )
+            self.assertEqual( first.status_code, 200 )
+            self.assertIsNotNone( first.headers.get('ETag') )
+
+            second = self.client.get( url, headers = self.get_api_headers() )
+            self.assertEqual( second.get_data(), first.get_data() )
+            self.assertEqual( second.headers.get('ETag'), first.headers.get('ETag') )
+
+        self.rename_in_db( 'Другое Имя' )
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        self.assertEqual( self.get_name(response), 'Иванов Иван Иванович' )
+
+    def test_etag( self ):
+        """ Запрос с актуальным If-None-Match получает 304
+        """
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        response.get_data()
+        etag = response.headers['ETag']
+
+        headers = dict( self.get_api_headers(), **{ 'If-None-Match': etag } )
+        response = self.client.get( '/imports/1/citizens', headers = headers )
+        self.assertEqual( response.status_code, 304 )
+        self.assertEqual( response.get_data(), b'' )
+
+        # ETag другого метода не совпадает
+        response = self.client.get( '/imports/1/citizens/birthdays', headers = headers )
+        self.assertEqual( response.status_code, 200 )
+
+    def test_not_modified_without_db( self ):
+        """ Повторный запрос с If-None-Match получает 304 без запросов к 
+        базе данных; после PATCH версия в кэше обновлена
+        """
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        response.get_data()
+        headers = dict( self.get_api_headers(), **{ 'If-None-Match': response.headers['ETag'] } )
+
+        statements = []
+        listener = lambda *args: statements.append( args[2] )
+        engine = db.get_engine( self.app )
+
+        event.listen( engine, 'before_cursor_execute', listener )
+        try:
+            response = self.client.get( '/imports/1/citizens', headers = headers )
+            self.assertEqual( response.status_code, 304 )
+            self.assertEqual( statements, [] )
+
+            self.client.patch( '/imports/1/citizens/1', headers = self.get_api_headers(),
+                               data = json.dumps({ "name": "Новое Имя" }) )
+            del statements[:]
+
+            response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+            self.assertEqual( self.get_name(response), 'Новое Имя' )
+            headers = dict( self.get_api_headers(), **{ 'If-None-Match': response.headers['ETag'] } )
+            del statements[:]
+
+            response = self.client.get( '/imports/1/citizens', headers = headers )
+            self.assertEqual( response.status_code, 304 )
+            self.assertEqual( statements, [] )
+        finally:
+            event.remove( engine, 'before_cursor_execute', listener )
+
+    def test_patch_invalidates( self ):
+        """ PATCH увеличивает версию выгрузки: кэш и ETag обновляются
+        """
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        response.get_data()
+        etag = response.headers['ETag']
+
+        self.client.patch(
+            '/imports/1/citizens/1',
+            headers = self.get_api_headers(),
+            data = json.dumps({ "name": "Новое Имя" })
+        )
+        self.assertEqual( Import.get_version(1), 2 )
+
+        headers = dict( self.get_api_headers(), **{ 'If-None-Match': etag } )
+        response = self.client.get( '/imports/1/citizens', headers = headers )
+        self.assertEqual( response.status_code, 200 )
+        self.assertNotEqual( response.headers['ETag'], etag )
+        self.assertEqual( self.get_name(response), 'Новое Имя' )
+
+    def test_rejected_patch( self ):
+        """ Отклоненный PATCH не меняет ни данные, ни кэш и ETag
+        """
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        response.get_data()
+        etag = response.headers['ETag']
+
+        response = self.client.patch(
+            '/imports/1/citizens/1',
+            headers = self.get_api_headers(),
+            data = json.dumps({ "name": "Новое Имя", "relatives": [1] })
+        )
+        self.assertEqual( response.status_code, 400 )
+        # Фиксация SQLALCHEMY_COMMIT_ON_TEARDOWN по окончании запроса
+        db.session.commit()
+        db.session.expire_all()
+
+        self.assertEqual( Import.get_version(1), 1 )
+        self.assertEqual( Citizen.query.filter_by( import_id = 1, citizen_id = 1 ).one().name, 'Иванов Иван Иванович' )
+
+        self.app.config['RESPONSE_CACHE'] = False
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        self.assertEqual( self.get_name(response), 'Иванов Иван Иванович' )
+        self.app.config['RESPONSE_CACHE'] = True
+
+        headers = dict( self.get_api_headers(), **{ 'If-None-Match': etag } )
+        response = self.client.get( '/imports/1/citizens', headers = headers )
+        self.assertEqual( response.status_code, 304 )
+
+    def test_disabled( self ):
+        """ Кэш отключен настройкой RESPONSE_CACHE
+        """
+        self.app.config['RESPONSE_CACHE'] = False
+
+        self.client.get( '/imports/1/citizens', headers = self.get_api_headers() ).get_data()
+        self.rename_in_db( 'Другое Имя' )
+
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        self.assertEqual( self.get_name(response), 'Другое Имя' )
+        self.assertIsNone( response.headers.get('ETag') )
+
+class SharedResponseCacheTestCase( ResponseCacheTestCase ):
+    """ Те же проверки с общим для процессов кэшем в файле SQLite
+    """
+    def configure( self ):
+        self.dir = tempfile.TemporaryDirectory()
+        self.app.config['RESPONSE_CACHE_BACKEND'] = 'sqlite'
+        self.app.config['RESPONSE_CACHE_PATH'] = os.path.join( self.dir.name, 'cache.sqlite' )
+        cache.init_app( self.app )
+
+    def tearDown( self ):
+        super().tearDown()
+        self.dir.cleanup()
+
+    def test_cleared_on_start( self ):
+        """ Общий кэш очищается только при запуске сервера (clear_shared): 
+        база могла быть пересоздана с теми же номерами и версиями выгрузок.
+        Создание приложения в рабочем процессе кэш не очищает
+        """
+        self.client.get( '/imports/1/citizens', headers = self.get_api_headers() ).get_data()
+        self.rename_in_db( 'Другое Имя' )
+
+        cache.init_app( self.app )
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        self.assertEqual( self.get_name(response), 'Иванов Иван Иванович' )
+
+        clear_shared( self.app.config )
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        self.assertEqual( self.get_name(response), 'Другое Имя' )
+
+    def test_version_not_published( self ):
+        """ Если новую версию не удалось записать в общий кэш, старая 
+        версия удаляется и читается из базы данных
+        """
+        self.client.get( '/imports/1/citizens', headers = self.get_api_headers() ).get_data()
+
+        with mock.patch.object( SQLiteCache, 'set_max', return_value = False ), \
+             self.assertLogs( self.app.logger, 'WARNING' ):
+            response = self.client.patch( '/imports/1/citizens/1', headers = self.get_api_headers(),
+                                          data = json.dumps({ "name": "Другое Имя" }) )
+            self.assertEqual( response.status_code, 200 )
+            db.session.commit()
+
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        self.assertEqual( self.get_name(response), 'Другое Имя' )
+
+    def test_version_shared( self ):
+        """ Версия выгрузки берется из общего кэша без обращения к базе
+        """
+        self.assertIsInstance( self.app.extensions['response_cache'], SQLiteCache )
+
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        response.get_data()
+        etag = response.headers['ETag']
+
+        # Изменение версии в обход API не видно до истечения TTL
+        Import.bump_version( 1 )
+        db.session.commit()
+
+        headers = dict( self.get_api_headers(), **{ 'If-None-Match': etag } )
+        response = self.client.get( '/imports/1/citizens', headers = headers )
+        self.assertEqual( response.status_code, 304 )
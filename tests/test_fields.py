@@ -0,0 +1,52 @@
+import json
+from app.validation import parse_fields
+from .base import ApiTestCase, make_citizen
+
+class FieldsTestCase( ApiTestCase ):
+    def setUp( self ):
+        super().setUp()
+        self.post_import([ make_citizen( citizen_id, apartment = citizen_id, relatives = relatives )
+                           for citizen_id, relatives in ( (1, [2]), (2, [1, 3]), (3, [2]) ) ])
+
+    def get( self, url ):
+        response = self.client.get( url, headers = self.get_api_headers() )
+        return response, json.loads( response.get_data( as_text = True ) ) if response.status_code == 200 else None
+
+    def test_parse_fields( self ):
+        """ Поля возвращаются в порядке схемы, неизвестные поля - ошибка
+        """
+        self.assertEqual( parse_fields( 'relatives,citizen_id,name' ), ( 'citizen_id', 'name', 'relatives' ) )
+        for value in ( '', 'name,', 'name,id', 'import_id' ):
+            with self.assertRaises( ValueError ):
+                parse_fields( value )
+
+    def test_projection( self ):
+        """ Выводятся только запрошенные поля, в том числе без relatives
+        """
+        _, full = self.get( '/imports/1/citizens' )
+
+        _, data = self.get( '/imports/1/citizens?fields=citizen_id,birth_date,relatives' )
+        self.assertEqual( data['data'], [ { field: citizen[field] for field in ('citizen_id', 'birth_date', 'relatives') }
+                                          for citizen in full['data'] ] )
+
+        _, data = self.get( '/imports/1/citizens?fields=name,citizen_id' )
+        self.assertEqual( data['data'], [ { 'citizen_id': citizen['citizen_id'], 'name': citizen['name'] }
+                                          for citizen in full['data'] ] )
+
+        for query in ( 'fields=', 'fields=name,passport', 'fields=id&limit=2' ):
+            response, _ = self.get( '/imports/1/citizens?' + query )
+            self.assertEqual( response.status_code, 400 )
+
+    def test_page_projection( self ):
+        """ Страницы учитывают fields, ссылка next сохраняет параметр
+        """
+        response, page = self.get( '/imports/1/citizens?limit=2&fields=relatives' )
+        self.assertEqual( response.status_code, 200 )
+        self.assertEqual( page['data'], [ { 'relatives': [2] }, { 'relatives': [1, 3] } ] )
+        self.assertIn( 'fields=relatives', page['next'] )
+
+        _, page = self.get( page['next'] )
+        self.assertEqual( page, { 'data': [ { 'relatives': [2] } ], 'next': None } )
+
+        _, page = self.get( '/imports/1/citizens?limit=5&fields=gender,apartment' )
+        self.assertEqual( page['data'], [ { 'apartment': i, 'gender': 'male' } for i in (1, 2, 3) ] )
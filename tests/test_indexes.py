@@ -0,0 +1,69 @@
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Import, Citizen, Relative, Present
+from .base import ApiTestCase
+
+class IndexesTestCase( ApiTestCase ):
+    """ Частые запросы выполняются по индексам, а не полным просмотром таблиц
+    """
+    def get_plan( self, query ):
+        """ План запроса SQLite (EXPLAIN QUERY PLAN) одной строкой
+        """
+        sql = str( query.statement.compile( db.engine, compile_kwargs = { 'literal_binds': True } ) )
+        return ' | '.join( row[-1] for row in db.session.execute( 'EXPLAIN QUERY PLAN ' + sql ) )
+
+    def assertUsesIndex( self, query, index ):
+        plan = self.get_plan( query )
+        self.assertIn( index, plan )
+        self.assertNotRegex( plan, r'SCAN (TABLE )?(citizens|relatives|presents)\b' )
+
+    def test_citizen_lookup( self ):
+        """ Поиск жителя выгрузки (PATCH, new_relatives)
+        """
+        query = Citizen.query.filter_by( import_id = 1, citizen_id = 2 )
+        self.assertUsesIndex( query, 'ix_citizens_import_id_citizen_id' )
+
+    def test_citizens_page( self ):
+        """ Страница жителей читается по индексу без сортировки
+        """
+        query = db.session.query( Citizen.citizen_id, Citizen.name ).\
+                           filter( Citizen.import_id == 1, Citizen.citizen_id > 100 ).\
+                           order_by( Citizen.citizen_id ).limit( 10 )
+        self.assertUsesIndex( query, 'ix_citizens_import_id_citizen_id' )
+        self.assertNotIn( 'TEMP B-TREE', self.get_plan( query ) )
+
+    def test_percentile( self ):
+        """ Города и даты рождения жителей выгрузки читаются из индекса
+        """
+        query = db.session.query( Citizen.town, Citizen.birth_date ).filter( Citizen.import_id == 1 )
+        self.assertUsesIndex( query, 'COVERING INDEX ix_citizens_import_id_town' )
+
+    def test_relatives( self ):
+        """ Родственники жителя и обратные связи
+        """
+        query = db.session.query( Relative.relative_id ).filter_by( import_id = 1, citizen_id = 2 )
+        self.assertUsesIndex( query, 'ix_relatives_import_id_citizen_id' )
+
+        query = db.session.query( Relative.citizen_id ).filter_by( import_id = 1, relative_id = 2 )
+        self.assertUsesIndex( query, 'ix_relatives_import_id_relative_id' )
+
+    def test_birthdays( self ):
+        """ Подарки выгрузки по месяцам
+        """
+        query = db.session.query( Present.month, Present.citizen_id, Present.presents ).\
+                           filter( Present.import_id == 1 ).\
+                           order_by( Present.month, Present.first_citizen, Present.first_relative )
+        self.assertUsesIndex( query, 'ix_presents_import_id_month' )
+        self.assertNotIn( 'TEMP B-TREE', self.get_plan( query ) )
+
+    def test_unique_citizen( self ):
+        """ Повтор citizen_id в одной выгрузке запрещен базой данных
+        """
+        import_id = Import.create()
+        row = { 'citizen_id': 1, 'town': 'Москва', 'street': 'Ленина', 'building': '1', 'apartment': 1,
+                'name': 'Иванов Иван', 'birth_date': '01.01.2000', 'gender': 'male', 'relatives': [] }
+
+        Citizen.insert_many( import_id, [ row ], 10 )
+        with self.assertRaises( IntegrityError ):
+            Citizen.insert_many( import_id, [ row ], 10 )
+        db.session.rollback()
@@ -0,0 +1,56 @@
+import json
+from unittest import mock
+from app import create_app
+from app.models import Import, Citizen, Relative
+from .base import ApiTestCase, make_citizen
+
+class ParallelImportTestCase( ApiTestCase ):
+    def configure( self ):
+        self.app.config['IMPORT_PROCESSES'] = 2
+        self.app.config['IMPORT_PARALLEL_MIN'] = 1
+        self.app.config['IMPORT_CHUNK_SIZE'] = 2
+
+    def get_citizens( self ):
+        return [ make_citizen( i, apartment = i, birth_date = "%02d.12.1986" % i, relatives = [ i % 5 + 1 ] )
+                 for i in range(1, 6) ]
+
+    def post( self, citizens ):
+        return self.client.post( '/imports', headers = self.get_api_headers(),
+                                 data = json.dumps({ "citizens": citizens }) )
+
+    def get_data( self, import_id ):
+        response = self.client.get( '/imports/%d/citizens' % import_id, headers = self.get_api_headers() )
+        return json.loads( response.get_data( as_text = True ) )['data']
+
+    def test_post_201( self ):
+        """ Проверка частями в пуле процессов дает тот же результат
+        """
+        self.assertEqual( self.post( self.get_citizens() ).status_code, 201 )
+
+        self.app.config['IMPORT_PROCESSES'] = 0
+        self.assertEqual( self.post( self.get_citizens() ).status_code, 201 )
+
+        self.assertEqual( self.get_data(1), self.get_data(2) )
+        self.assertEqual( [ c['relatives'] for c in self.get_data(1) ], [ [2, 5], [3, 1], [4, 2], [5, 3], [1, 4] ] )
+
+    def test_post_400( self ):
+        """ Ошибка в любой части отклоняет всю выгрузку
+        """
+        invalid = self.get_citizens()
+        invalid[-1]['birth_date'] = '31.02.1986'
+
+        duplicate = self.get_citizens()
+        duplicate[-1]['citizen_id'] = 1
+
+        for citizens in ( invalid, duplicate ):
+            self.assertEqual( self.post( citizens ).status_code, 400 )
+            self.assertEqual( Import.query.count(), 0 )
+            self.assertEqual( Citizen.query.count(), 0 )
+            self.assertEqual( Relative.query.count(), 0 )
+
+    def test_async_rejected( self ):
+        """ Проверка в процессах несовместима с фоновой загрузкой
+        """
+        with mock.patch.multiple( 'config.TestingConfig', IMPORT_PROCESSES = 2, IMPORT_ASYNC = True ):
+            with self.assertRaises( ValueError ):
+                create_app('testing')
@@ -0,0 +1,139 @@
+import json, multiprocessing, time, threading
+from datetime import datetime, timedelta
+from unittest import mock
+from app import db
+from app.models import Import, ImportJob
+from app.jobs import owner
+from .base import ApiTestCase, make_citizen
+
+class ImportJobsTestCase( ApiTestCase ):
+    def configure( self ):
+        self.app.config['IMPORT_ASYNC'] = True
+
+    def get_citizens( self ):
+        return [
+            make_citizen( 1, relatives = [2] ),
+            make_citizen( 2, town = "Керчь", name = "Иванов Сергей Иванович", birth_date = "01.04.1997" )
+        ]
+
+    def post( self, citizens ):
+        return self.client.post( '/imports', headers = self.get_api_headers(),
+                                 data = json.dumps({ "citizens": citizens }) )
+
+    def wait( self, location ):
+        """ Опрос статуса задачи до завершения
+        """
+        for _ in range(200):
+            response = self.client.get( location, headers = self.get_api_headers() )
+            self.assertEqual( response.status_code, 200 )
+            job = json.loads( response.get_data( as_text = True ) )['data']
+            if job['status'] in ('done', 'failed'):
+                return job
+            time.sleep( 0.05 )
+        self.fail( 'job is not finished' )
+
+    def test_post_202( self ):
+        """ Фоновая загрузка: 202, затем статус done и import_id
+        """
+        response = self.post( self.get_citizens() )
+        self.assertEqual( response.status_code, 202 )
+
+        json_response = json.loads( response.get_data( as_text = True ) )
+        self.assertEqual( json_response['data'], {'job_id': 1, 'status': 'queued'} )
+        self.assertTrue( response.headers['Location'].endswith('/imports/jobs/1') )
+
+        job = self.wait( response.headers['Location'] )
+        self.assertEqual( job, {'job_id': 1, 'status': 'done', 'citizens': 2, 'import_id': 1} )
+
+        # Родство дополнено так же, как при обычной загрузке
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        json_response = json.loads( response.get_data( as_text = True ) )
+        self.assertEqual( [ c['relatives'] for c in json_response['data'] ], [ [2], [1] ] )
+
+    def test_post_failed( self ):
+        """ Ошибка проверки выгрузки отражается в статусе задачи
+        """
+        citizens = self.get_citizens()
+        citizens[1]['gender'] = 'unknown'
+
+        response = self.post( citizens )
+        self.assertEqual( response.status_code, 202 )
+
+        job = self.wait( response.headers['Location'] )
+        self.assertEqual( job['status'], 'failed' )
+        self.assertEqual( job['error'], 'Bad Request' )
+        self.assertNotIn( 'import_id', job )
+        self.assertEqual( Import.query.count(), 0 )
+
+        # Пустая выгрузка отклоняется сразу
+        self.assertEqual( self.post( [] ).status_code, 400 )
+        self.assertEqual( self.client.get( '/imports/jobs/100', headers = self.get_api_headers() ).status_code, 404 )
+
+    def test_queue_full( self ):
+        """ При заполненной очереди загрузка отклоняется с кодом 503
+        """
+        self.app.config['IMPORT_WORKERS'] = 1
+        self.app.config['IMPORT_QUEUE_SIZE'] = 0
+        self.app.extensions['import_jobs'].pid = None
+
+        started, release = threading.Event(), threading.Event()
+        def save_import( *args ):
+            started.set()
+            release.wait( 5 )
+            return None
+
+        with mock.patch( 'app.jobs.save_import', save_import ):
+            first = self.post( self.get_citizens() )
+            self.assertEqual( first.status_code, 202 )
+            started.wait( 5 )
+
+            self.assertEqual( self.post( self.get_citizens() ).status_code, 503 )
+            release.set()
+            self.wait( first.headers['Location'] )
+
+        self.assertEqual( ImportJob.query.count(), 1 )
+
+    def test_owner_exited( self ):
+        """ Незавершенная задача завершившегося процесса отмечается как failed
+        """
+        process = multiprocessing.get_context('fork').Process( target = lambda: None )
+        process.start()
+        process.join()
+
+        running = ImportJob.create( 2, owner() )
+        orphaned = ImportJob.create( 2, owner( process.pid ) )
+        other = ImportJob.create( 2, 'other-host:%d' % process.pid )
+
+        for job_id, status in ( (running, 'queued'), (orphaned, 'failed'), (other, 'queued') ):
+            response = self.client.get( '/imports/jobs/%d' % job_id, headers = self.get_api_headers() )
+            job = json.loads( response.get_data( as_text = True ) )['data']
+            self.assertEqual( job['status'], status )
+
+        self.assertEqual( ImportJob.query.get( orphaned ).error, 'Worker Exited' )
+
+    def test_owner_pid_reused( self ):
+        """ Номер завершившегося процесса занят другим процессом: задача
+        отмечается как failed по несовпадению времени запуска
+        """
+        host, pid, started = owner().split(':')
+        reused = ImportJob.create( 2, '%s:%s:%d' % ( host, pid, int(started) - 1 ) )
+
+        response = self.client.get( '/imports/jobs/%d' % reused, headers = self.get_api_headers() )
+        job = json.loads( response.get_data( as_text = True ) )['data']
+        self.assertEqual( ( job['status'], job['error'] ), ( 'failed', 'Worker Exited' ) )
+
+    def test_timeout( self ):
+        """ Задача, не завершенная за IMPORT_JOB_TIMEOUT секунд, отмечается
+        как failed на любом сервере
+        """
+        stale = ImportJob.create( 2, 'other-host:1' )
+        fresh = ImportJob.create( 2, 'other-host:1' )
+        ImportJob.query.filter_by( id = stale ).update({ 'created': datetime.utcnow() - timedelta( hours = 2 ) })
+        db.session.commit()
+
+        for job_id, status in ( (stale, 'failed'), (fresh, 'queued') ):
+            response = self.client.get( '/imports/jobs/%d' % job_id, headers = self.get_api_headers() )
+            job = json.loads( response.get_data( as_text = True ) )['data']
+            self.assertEqual( job['status'], status )
+
+        self.assertEqual( ImportJob.query.get( stale ).error, 'Timeout' )
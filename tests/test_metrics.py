@@ -0,0 +1,110 @@
+import multiprocessing, os, tempfile
+from app import create_app, db, metrics
+from .base import ApiTestCase, make_citizen
+
+class MetricsTestCase( ApiTestCase ):
+    def configure( self ):
+        self.dir = tempfile.TemporaryDirectory()
+        self.app.config['METRICS'] = True
+        self.app.config['METRICS_DIR'] = self.dir.name
+        metrics.init_app( self.app, db )
+
+    def tearDown( self ):
+        super().tearDown()
+        self.dir.cleanup()
+
+    def get_metrics( self ):
+        """ Значения метрик: 'имя{метки}' -> число
+        """
+        response = self.client.get( '/metrics' )
+        self.assertEqual( response.status_code, 200 )
+        self.assertEqual( response.mimetype, 'text/plain' )
+
+        values = {}
+        for line in response.get_data( as_text = True ).splitlines():
+            if not line.startswith('#'):
+                sample, value = line.rsplit( ' ', 1 )
+                values[sample] = float(value)
+        return values
+
+    def test_requests( self ):
+        """ Запросы, размеры, выгрузки, кэш и пул соединений
+        """
+        self.post_import([ make_citizen(i) for i in range(1, 4) ])
+
+        for _ in range(2):
+            self.client.get( '/imports/1/citizens', headers = self.get_api_headers() ).get_data()
+        self.client.get( '/imports/2/citizens', headers = self.get_api_headers() )
+
+        values = self.get_metrics()
+        citizens = '/imports/<int:import_id>/citizens'
+
+        self.assertEqual( values['http_requests_total{method="POST",route="/imports",status="201"}'], 1 )
+        self.assertEqual( values['http_requests_total{method="GET",route="%s",status="200"}' % citizens], 2 )
+        self.assertEqual( values['http_requests_total{method="GET",route="%s",status="404"}' % citizens], 1 )
+        self.assertEqual( values['http_request_duration_seconds_count{route="%s"}' % citizens], 3 )
+        self.assertEqual( values['http_request_duration_seconds_bucket{route="/imports",le="+Inf"}'], 1 )
+        self.assertGreater( values['http_request_size_bytes_sum{route="/imports"}'], 0 )
+        self.assertGreater( values['http_response_size_bytes_sum{route="%s"}' % citizens], 0 )
+
+        self.assertEqual( values['import_citizens_count'], 1 )
+        self.assertEqual( values['import_citizens_sum'], 3 )
+        self.assertEqual( values['import_citizens_bucket{le="10"}'], 1 )
+
+        self.assertEqual( values['response_cache_total{result="miss",route="%s"}' % citizens], 1 )
+        self.assertEqual( values['response_cache_total{result="hit",route="%s"}' % citizens], 1 )
+
+        self.assertGreater( values['db_pool_checkout_seconds_count'], 0 )
+
+    def test_processes( self ):
+        """ Метрики рабочих процессов суммируются
+        """
+        registry = self.app.extensions['metrics']
+        registry.observe( 'import_citizens', {}, 5 )
+
+        def worker():
+            registry.observe( 'import_citizens', {}, 500 )
+            registry.flush( force = True )
+
+        process = multiprocessing.get_context('fork').Process( target = worker )
+        process.start()
+        process.join()
+
+        values = self.get_metrics()
+        self.assertEqual( values['import_citizens_count'], 2 )
+        self.assertEqual( values['import_citizens_sum'], 505 )
+        self.assertEqual( values['import_citizens_bucket{le="10"}'], 1 )
+        self.assertEqual( values['import_citizens_bucket{le="1000"}'], 2 )
+
+    def test_exited( self ):
+        """ Метрики завершившегося процесса переносятся в общий файл,
+        сумма не меняется; очистка каталога удаляет все метрики
+        """
+        registry = self.app.extensions['metrics']
+        registry.observe( 'import_citizens', {}, 5 )
+
+        def worker():
+            registry.observe( 'import_citizens', {}, 500 )
+            registry.flush( force = True )
+
+        for _ in range(2):
+            process = multiprocessing.get_context('fork').Process( target = worker )
+            process.start()
+            process.join()
+            metrics.merge( self.dir.name, process.pid )
+
+        values = self.get_metrics()
+        self.assertEqual( values['import_citizens_count'], 3 )
+        self.assertEqual( values['import_citizens_sum'], 1005 )
+        self.assertEqual( sorted( os.listdir( self.dir.name ) ),
+                          sorted([ metrics.EXITED, os.path.basename( registry.path ) ]) )
+
+        metrics.clear( self.dir.name )
+        registry.values.clear()
+        self.assertNotIn( 'import_citizens_count', self.get_metrics() )
+
+    def test_disabled( self ):
+        """ Без METRICS метод недоступен
+        """
+        app = create_app('testing')
+        self.assertEqual( app.test_client().get('/metrics').status_code, 404 )
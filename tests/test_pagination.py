@@ -0,0 +1,54 @@
+import json
+from .base import ApiTestCase, make_citizen
+
+class PaginationTestCase( ApiTestCase ):
+    def setUp( self ):
+        super().setUp()
+
+        ids = [ 10, 3, 7, 1, 5, 12, 8 ]
+        self.post_import([ make_citizen( citizen_id, apartment = citizen_id, relatives = [ ids[ (i + 1) % len(ids) ] ] )
+                           for i, citizen_id in enumerate(ids) ])
+
+    def get( self, url ):
+        response = self.client.get( url, headers = self.get_api_headers() )
+        return response, json.loads( response.get_data( as_text = True ) ) if response.status_code == 200 else None
+
+    def test_pages( self ):
+        """ Обход страниц по ссылкам next дает всех жителей в порядке citizen_id
+        """
+        _, full = self.get( '/imports/1/citizens' )
+        self.assertNotIn( 'next', full )
+
+        pages, url = [], '/imports/1/citizens?limit=3'
+        while url is not None:
+            response, page = self.get( url )
+            self.assertEqual( response.status_code, 200 )
+            self.assertLessEqual( len(page['data']), 3 )
+            if page['next'] is not None:
+                self.assertEqual( response.headers['Link'], '<%s>; rel="next"' % page['next'] )
+            pages.append( page['data'] )
+            url = page['next']
+
+        self.assertEqual( [ len(page) for page in pages ], [ 3, 3, 1 ] )
+        self.assertEqual( [ citizen for page in pages for citizen in page ],
+                          sorted( full['data'], key = lambda citizen: citizen['citizen_id'] ) )
+
+        # Страница после последнего жителя
+        _, page = self.get( '/imports/1/citizens?after_citizen_id=12' )
+        self.assertEqual( page, { 'data': [], 'next': None } )
+
+    def test_page_size( self ):
+        """ Размер страницы ограничен CITIZENS_PAGE_MAX, некорректные параметры - 400
+        """
+        self.app.config['CITIZENS_PAGE_MAX'] = 2
+        _, page = self.get( '/imports/1/citizens?limit=100&after_citizen_id=3' )
+        self.assertEqual( [ citizen['citizen_id'] for citizen in page['data'] ], [ 5, 7 ] )
+        self.assertIn( 'limit=2', page['next'] )
+        self.assertIn( 'after_citizen_id=7', page['next'] )
+
+        for query in ( 'limit=0', 'limit=x', 'after_citizen_id=1.5' ):
+            response, _ = self.get( '/imports/1/citizens?' + query )
+            self.assertEqual( response.status_code, 400 )
+
+        response, _ = self.get( '/imports/2/citizens?limit=1' )
+        self.assertEqual( response.status_code, 404 )
@@ -0,0 +1,79 @@
+import json, random
+from app import db
+from app.models import Citizen, Relative, Present
+from .base import ApiTestCase, make_citizen, random_date, random_relatives, random_import
+
+class PresentsTestCase( ApiTestCase ):
+    def setUp( self ):
+        super().setUp()
+        self.random = random.Random( 42 )
+
+    def expected( self, import_id ):
+        """ Подарки, посчитанные по жителям и связям выгрузки
+        """
+        relatives = Relative.get_map( import_id )
+        presents = dict( (i, {}) for i in range(1,13) )
+
+        for citizen in Citizen.query.filter_by( import_id = import_id ).order_by( Citizen.id ):
+            counter = presents[citizen.birth_month]
+            for rel_id in relatives.get( citizen.citizen_id, [] ):
+                counter[rel_id] = counter.get(rel_id, 0) + 1
+
+        return dict( (str(month), [ { 'citizen_id': citizen_id, 'present': present }
+                                    for citizen_id, present in counter.items() ])
+                     for month, counter in presents.items() )
+
+    def get_birthdays( self, import_id ):
+        response = self.client.get( '/imports/%d/citizens/birthdays' % import_id, headers = self.get_api_headers() )
+        self.assertEqual( response.status_code, 200 )
+        return json.loads( response.get_data( as_text = True ) )['data']
+
+    def test_incremental( self ):
+        """ Таблица подарков после серии изменений совпадает с расчетом 
+        по текущим данным выгрузки
+        """
+        count = 30
+        for import_id in (1, 2):
+            self.post_import( random_import( self.random, count ) )
+
+        self.assertEqual( self.get_birthdays(1), self.expected(1) )
+
+        for _ in range(40):
+            citizen_id = self.random.randint(1, count)
+            data = self.random.choice([
+                { "birth_date": random_date( self.random ) },
+                { "relatives": random_relatives( self.random, citizen_id, count ) },
+                { "birth_date": random_date( self.random ), "relatives": random_relatives( self.random, citizen_id, count ) },
+                { "name": "Петров Петр" }
+            ])
+            response = self.client.patch( '/imports/1/citizens/%d' % citizen_id,
+                                          headers = self.get_api_headers(), data = json.dumps(data) )
+            self.assertEqual( response.status_code, 200 )
+
+            self.assertEqual( self.get_birthdays(1), self.expected(1) )
+
+        # Другая выгрузка не затронута
+        self.assertEqual( self.get_birthdays(2), self.expected(2) )
+
+        rows = Present.query.filter_by( import_id = 1 ).count()
+        Present.rebuild( 1 )
+        self.assertEqual( Present.query.filter_by( import_id = 1 ).count(), rows )
+
+    def test_rejected_patch( self ):
+        """ Отклоненный PATCH (житель в собственных родственниках) не 
+        сохраняет изменения остальных полей и не портит подарки
+        """
+        self.post_import([ make_citizen( 1, birth_date = '05.02.1990', relatives = [2] ),
+                           make_citizen( 2, relatives = [1] ) ])
+        before = self.get_birthdays(1)
+
+        response = self.client.patch( '/imports/1/citizens/1', headers = self.get_api_headers(),
+                                      data = json.dumps({ "birth_date": "05.07.1990", "relatives": [1] }) )
+        self.assertEqual( response.status_code, 400 )
+        # В тестах контекст приложения общий для запросов, поэтому фиксация
+        # SQLALCHEMY_COMMIT_ON_TEARDOWN по окончании запроса выполняется явно
+        db.session.commit()
+
+        self.assertEqual( Citizen.query.filter_by( import_id = 1, citizen_id = 1 ).one().birth_date.month, 2 )
+        self.assertEqual( self.get_birthdays(1), before )
+        self.assertEqual( self.get_birthdays(1), self.expected(1) )
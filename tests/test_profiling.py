@@ -0,0 +1,59 @@
+import json
+from app import create_app, db, profiling
+from .base import ApiTestCase, make_citizen
+
+class ProfilingTestCase( ApiTestCase ):
+    def configure( self ):
+        self.app.config['PROFILING'] = True
+        self.app.config['RESPONSE_CACHE'] = False
+        profiling.init_app( self.app, db )
+
+    def setUp( self ):
+        super().setUp()
+        self.post_import([ make_citizen( 1, relatives = [2] ),
+                           make_citizen( 2, town = "Керчь", name = "Иванов Сергей Иванович",
+                                         birth_date = "01.04.1997", relatives = [1] ) ])
+
+    def get_timing( self, response ):
+        """ Server-Timing -> { name: (dur, desc) }
+        """
+        timing = {}
+        for metric in response.headers['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            params = dict( param.split('=', 1) for param in params )
+            timing[name] = ( float(params['dur']), params.get('desc') )
+        return timing
+
+    def test_server_timing( self ):
+        """ Время обработки, SQL-запросы и кодирование JSON в заголовке ответа
+        """
+        response = self.client.get( '/imports/1/citizens/birthdays', headers = self.get_api_headers() )
+        self.assertEqual( response.status_code, 200 )
+
+        timing = self.get_timing( response )
+        self.assertGreater( timing['app'][0], 0 )
+        self.assertGreaterEqual( timing['app'][0], timing['db'][0] + timing['serialize'][0] )
+
+        # Проверка выгрузки и чтение подарков
+        self.assertEqual( timing['db'][1], '"2 queries"' )
+
+        response = self.client.patch( '/imports/1/citizens/1', headers = self.get_api_headers(),
+                                      data = json.dumps({ "name": "Новое Имя" }) )
+        self.assertIn( 'parse', self.get_timing( response ) )
+
+    def test_slow_request( self ):
+        """ Запросы дольше SLOW_REQUEST_THRESHOLD записываются в журнал
+        """
+        self.app.config['SLOW_REQUEST_THRESHOLD'] = 0
+        with self.assertLogs( self.app.logger, 'WARNING' ) as logs:
+            self.client.get( '/imports/1/towns/stat/percentile/age', headers = self.get_api_headers() )
+
+        self.assertEqual( len(logs.output), 1 )
+        self.assertRegex( logs.output[0], r'Slow request GET /imports/1/towns/stat/percentile/age: 200, .* 1 queries' )
+
+    def test_disabled( self ):
+        """ Без PROFILING заголовок не добавляется
+        """
+        app = create_app('testing')
+        response = app.test_client().get( '/imports/1/citizens/birthdays', headers = self.get_api_headers() )
+        self.assertNotIn( 'Server-Timing', response.headers )
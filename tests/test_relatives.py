@@ -0,0 +1,62 @@
+import json
+from sqlalchemy import event
+from app import db
+from app.models import Relative
+from .base import ApiTestCase, make_citizen
+
+class RelativesTestCase( ApiTestCase ):
+    def configure( self ):
+        self.app.config['RESPONSE_CACHE'] = False
+
+    def setUp( self ):
+        super().setUp()
+        self.post_import([ make_citizen( i, apartment = i ) for i in range(1, 1202) ])
+
+    def patch( self, relatives ):
+        """ PATCH родственников жителя 1; возвращает число SQL-запросов
+        """
+        statements = []
+        listener = lambda *args: statements.append( args[2] )
+        engine = db.get_engine( self.app )
+        event.listen( engine, 'before_cursor_execute', listener )
+        try:
+            response = self.client.patch( '/imports/1/citizens/1', headers = self.get_api_headers(),
+                                          data = json.dumps({ "relatives": relatives }) )
+        finally:
+            event.remove( engine, 'before_cursor_execute', listener )
+
+        self.assertEqual( response.status_code, 200 )
+        self.assertEqual( json.loads( response.get_data( as_text = True ) )['data']['relatives'], relatives )
+        return len(statements)
+
+    def test_statements( self ):
+        """ Число запросов PATCH не зависит от числа родственников
+        (в пределах одной порции IN по 500 жителей)
+        """
+        self.patch( [ 2, 3 ] )
+        few  = self.patch( [ 3, 4 ] )
+        many = self.patch( list( range(5, 400) ) )
+        self.assertEqual( few, many )
+        self.assertEqual( few, self.patch( list( range(2, 300, 2) ) ) )
+
+        graph = Relative.get_map( 1 )
+        self.assertEqual( graph[1], list( range(2, 300, 2) ) )
+        self.assertEqual( sorted( citizen_id for citizen_id, relatives in graph.items() if 1 in relatives ),
+                          list( range(2, 300, 2) ) )
+
+    def test_duplicates( self ):
+        """ Повторяющиеся родственники: обратная связь добавляется один 
+        раз, а при удалении родственника удаляются все его обратные связи
+        """
+        self.patch( [ 2, 2, 3 ] )
+        graph = Relative.get_map( 1 )
+        self.assertEqual( ( graph[2], graph[3] ), ( [1], [1] ) )
+
+        response = self.client.patch( '/imports/1/citizens/2', headers = self.get_api_headers(),
+                                      data = json.dumps({ "relatives": [1, 1] }) )
+        self.assertEqual( response.status_code, 200 )
+        self.assertEqual( Relative.get_map( 1 )[1], [ 2, 2, 3 ] )
+
+        self.patch( [ 3 ] )
+        graph = Relative.get_map( 1 )
+        self.assertEqual( ( graph.get(2, []), graph[3] ), ( [], [1] ) )
@@ -0,0 +1,40 @@
+import unittest, json
+from app import create_app
+from app import serializer
+from app.serializer import BACKENDS, get_backend, JSONBackend
+
+class SerializerTestCase( unittest.TestCase ):
+    def test_backends( self ):
+        """ Все установленные кодировщики дают одинаковый документ
+        """
+        payload = { 'data': [ { 'town': 'Москва', 'relatives': [1, 2], 'apartment': 7, 'p50': 56.5 } ] }
+
+        for name, cls in BACKENDS.items():
+            try:
+                backend = cls()
+            except ImportError:
+                continue
+
+            data = backend.dumps( payload )
+            self.assertIsInstance( data, bytes )
+            self.assertEqual( json.loads( data ), payload )
+            self.assertEqual( backend.loads( data ), payload )
+
+    def test_auto( self ):
+        """ Выбор кодировщика по умолчанию и стандартный json по имени
+        """
+        self.assertIn( get_backend('auto').name, BACKENDS )
+        self.assertIsInstance( get_backend('json'), JSONBackend )
+        self.assertEqual( get_backend('json').name, 'json' )
+
+    def test_app_backend( self ):
+        """ Ответы приложения кодируются выбранным кодировщиком
+        """
+        app = create_app('testing')
+        app.config['JSON_BACKEND'] = 'json'
+        serializer.init_app( app )
+        self.assertEqual( app.extensions['json_backend'].name, 'json' )
+
+        response = app.test_client().get('/imports/1/citizens/unknown')
+        self.assertEqual( response.status_code, 404 )
+        self.assertEqual( json.loads( response.get_data( as_text = True ) ), { 'Error 404': 'Not Found' } )
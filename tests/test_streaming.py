@@ -0,0 +1,146 @@
+import unittest, io, json
+from sqlalchemy import event
+from app import db
+from app.models import Import, Citizen, Relative
+from app.streaming import iter_citizens, StreamError
+from .base import ApiTestCase, make_citizen
+
+class IterCitizensTestCase( unittest.TestCase ):
+    def parse( self, data, max_item_size = 1024, read_size = 3 ):
+        stream = io.BytesIO( data.encode('utf-8') )
+        return list( iter_citizens( stream, max_item_size, read_size ) )
+
+    def test_parse( self ):
+        """ Разбор документа по частям произвольного размера
+        """
+        citizens = [ { 'citizen_id': i, 'name': 'Житель №%d' % i, 'relatives': [i, 12345] } for i in range(20) ]
+        data = json.dumps({ 'before': [1, {'a': 2}], 'citizens': citizens, 'after': 12345 }, ensure_ascii = False )
+
+        for read_size in (1, 2, 7, 64, 4096):
+            self.assertEqual( self.parse( data, read_size = read_size ), citizens )
+
+        self.assertEqual( self.parse(' { "citizens" : [ ] } '), [] )
+
+    def test_malformed( self ):
+        """ Некорректные документы
+        """
+        for data in ( '', '[]', '{}', '{"citizens": {}}', '{"citizens": [1, 2', '{"citizens": [1 2]}',
+                      '{"citizens": [1], "citizens": [2]}', '{"citizens": []} []', '{"other": 1}',
+                      '{citizens: []}', '{"citizens": [1],}' ):
+            with self.assertRaises( StreamError ):
+                self.parse( data )
+
+    def test_item_too_large( self ):
+        """ Элемент массива больше допустимого размера
+        """
+        data = json.dumps({ 'citizens': [ { 'name': 'x' * 100 } ] })
+        # Элемент целиком в одной прочитанной части или на границе частей
+        for read_size in (3, 64 * 1024):
+            with self.assertRaises( StreamError ):
+                self.parse( data, max_item_size = 50, read_size = read_size )
+
+class StreamingImportTestCase( ApiTestCase ):
+    def configure( self ):
+        self.app.config['IMPORT_STREAMING'] = True
+        self.app.config['IMPORT_BATCH_SIZE'] = 2
+
+    def get_citizens( self ):
+        return [ make_citizen( i, apartment = i, relatives = [ i % 5 + 1 ] ) for i in range(1, 6) ]
+
+    def test_post_201( self ):
+        """ Потоковая загрузка выгрузки, записываемой несколькими пакетами
+        """
+        citizen = self.get_citizens()
+        response = self.client.post(
+            '/imports',
+            headers = self.get_api_headers(),
+            data = json.dumps({ "citizens" : citizen })
+        )
+
+        self.assertEqual( response.status_code, 201 )
+        json_response = json.loads( response.get_data( as_text = True ) )
+        self.assertEqual( json_response['data'], {'import_id': 1} )
+
+        # Родство дополнено так же, как при обычной загрузке
+        response = self.client.get( '/imports/1/citizens', headers = self.get_api_headers() )
+        json_response = json.loads( response.get_data( as_text = True ) )
+        self.assertEqual( [ c['relatives'] for c in json_response['data'] ],
+                          [ [2, 5], [3, 1], [4, 2], [5, 3], [1, 4] ] )
+
+    def test_post_400( self ):
+        """ Ошибка в конце потока: выгрузка не сохраняется
+        """
+        invalid = self.get_citizens()
+        invalid[-1]['gender'] = 'unknown'
+
+        duplicate = self.get_citizens()
+        duplicate[-1]['citizen_id'] = 1
+
+        missing = self.get_citizens()
+        missing[-1]['relatives'] = [7]
+
+        for data in ( json.dumps({ "citizens" : invalid }), json.dumps({ "citizens" : duplicate }),
+                      json.dumps({ "citizens" : missing }), json.dumps({ "citizens" : [] }),
+                      json.dumps({ "citizens" : self.get_citizens() })[:-10] ):
+            response = self.client.post( '/imports', headers = self.get_api_headers(), data = data )
+
+            self.assertEqual( response.status_code, 400 )
+            self.assertEqual( Import.query.count(), 0 )
+            self.assertEqual( Citizen.query.count(), 0 )
+            self.assertEqual( Relative.query.count(), 0 )
+
+    def test_citizen_too_large( self ):
+        """ Житель больше IMPORT_MAX_CITIZEN_SIZE отклоняется, даже если
+        умещается в одну прочитанную часть потока
+        """
+        data = json.dumps({ "citizens" : self.get_citizens() })
+        self.app.config['IMPORT_MAX_CITIZEN_SIZE'] = 100
+
+        response = self.client.post( '/imports', headers = self.get_api_headers(), data = data )
+        self.assertEqual( response.status_code, 400 )
+        self.assertEqual( Import.query.count(), 0 )
+
+        self.app.config['IMPORT_MAX_CITIZEN_SIZE'] = 1000
+        response = self.client.post( '/imports', headers = self.get_api_headers(), data = data )
+        self.assertEqual( response.status_code, 201 )
+
+    def test_post_413( self ):
+        """ Тело больше MAX_CONTENT_LENGTH отклоняется до чтения, в том 
+        числе при обычной (не потоковой) загрузке
+        """
+        data = json.dumps({ "citizens" : self.get_citizens() })
+        self.app.config['MAX_CONTENT_LENGTH'] = len(data) - 1
+
+        for streaming in (True, False):
+            self.app.config['IMPORT_STREAMING'] = streaming
+            response = self.client.post( '/imports', headers = self.get_api_headers(), data = data )
+            self.assertEqual( response.status_code, 413 )
+            self.assertEqual( Import.query.count(), 0 )
+
+        self.app.config['MAX_CONTENT_LENGTH'] = len(data)
+        response = self.client.post( '/imports', headers = self.get_api_headers(), data = data )
+        self.assertEqual( response.status_code, 201 )
+
+    def test_write_after_body( self ):
+        """ Запись в базу начинается только после чтения всего тела запроса
+        """
+        # Тело читается частями по 64 КБ
+        citizens = [ dict( citizen, citizen_id = i, relatives = [] ) for i, citizen in
+                     enumerate( self.get_citizens() * 200, 1 ) ]
+        data = json.dumps({ "citizens" : citizens }).encode('utf-8')
+        self.assertGreater( len(data), 2 * 64 * 1024 )
+
+        stream, positions = io.BytesIO( data ), []
+        listener = lambda *args: positions.append( stream.tell() )
+        engine = db.get_engine( self.app )
+
+        event.listen( engine, 'before_cursor_execute', listener )
+        try:
+            response = self.client.post( '/imports', headers = self.get_api_headers(),
+                                         input_stream = stream, content_length = len(data) )
+        finally:
+            event.remove( engine, 'before_cursor_execute', listener )
+
+        self.assertEqual( response.status_code, 201 )
+        self.assertTrue( positions )
+        self.assertEqual( set(positions), { len(data) } )
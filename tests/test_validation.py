@@ -0,0 +1,89 @@
+import unittest, random
+from datetime import datetime, date, timedelta
+from app.validation import schema, parse_date, cerberus, cerberus_lite, validator, validator_lite, FastValidator
+from .base import make_citizen
+
+class ValidationTestCase( unittest.TestCase ):
+    """ Сравнение FastValidator с эталонной проверкой Cerberus
+    """
+    def setUp( self ):
+        self.random = random.Random( 42 )
+
+    def get_citizen( self ):
+        return make_citizen( 1, relatives = [2, 3] )
+
+    def reference( self, validator, document ):
+        """ Решение Cerberus; для birth_date = None правило borndate 
+        выполняется после ошибки nullable и бросает TypeError
+        """
+        try:
+            return validator.validate( document )
+        except TypeError:
+            return False
+
+    def get_values( self ):
+        tomorrow = date.today() + timedelta( days = 1 )
+        return [
+            None, True, False, -1, 0, 1, 2**70, 1.0, float('nan'), '', ' ', 'x', 'x' * 256, 'x' * 257,
+            'male', 'female', 'Male', [], [1], [1, True], [None], ['1'], [1.0], (1, 2), {}, {'a': 1},
+            '26.12.1986', '1.1.2000', ' 1.1.2000', '01.1.2000 ', '1.1.2000\n', '29.02.2000', '29.02.1900',
+            '31.04.2000', '00.01.2000', '01.13.2000', '01.01.0000', '01.01.12345', '25.12.١٩٨٦', '٢٥.١٢.١٩٨٦',
+            '2000-01-01', tomorrow.strftime('%d.%m.%Y'), date.today().strftime('%d.%m.%Y')
+        ]
+
+    def get_documents( self, count ):
+        fields, values = list(schema) + [ 'unknown' ], self.get_values()
+
+        for _ in range( count ):
+            citizen = self.get_citizen()
+            for _ in range( self.random.randint(0, 2) ):
+                field = self.random.choice( fields )
+                if self.random.random() < 0.2:
+                    citizen.pop( field, None )
+                else:
+                    citizen[field] = self.random.choice( values )
+            yield citizen
+
+    def test_same_decisions( self ):
+        """ Те же решения, что и у Cerberus, для строгой и частичной схем
+        """
+        accepted = 0
+        for document in self.get_documents( 1000 ):
+            expected = self.reference( cerberus, document )
+            self.assertEqual( validator.validate( document ), expected, document )
+            self.assertEqual( validator_lite.validate( document ), self.reference( cerberus_lite, document ), document )
+            accepted += expected
+
+        # Среди случайных документов есть и корректные, и некорректные
+        self.assertTrue( 0 < accepted < 1000 )
+
+    def test_validate_many( self ):
+        """ Проверка пакета документов
+        """
+        documents = [ self.get_citizen() for _ in range(10) ]
+        self.assertTrue( validator.validate_many( documents ) )
+        self.assertTrue( validator.validate_many( [] ) )
+
+        documents[5]['gender'] = 'unknown'
+        self.assertFalse( validator.validate_many( documents ) )
+        self.assertFalse( validator.validate_many( [ self.get_citizen(), [1] ] ) )
+
+    def test_parse_date( self ):
+        """ parse_date принимает те же строки, что и strptime
+        """
+        for value in self.get_values():
+            if not isinstance( value, str ):
+                continue
+            try:
+                expected = datetime.strptime( value, '%d.%m.%Y' ).date()
+            except ValueError:
+                with self.assertRaises( ValueError ):
+                    parse_date( value )
+            else:
+                self.assertEqual( parse_date( value ), expected )
+
+    def test_unsupported_rule( self ):
+        """ Правило схемы без реализации - ошибка при создании проверки
+        """
+        with self.assertRaises( ValueError ):
+            FastValidator({ 'name': { 'type': 'string', 'regex': '.*' } })